@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import base64
+import time
+import uuid
+from pathlib import Path
+
+import magic
+from langchain_core.messages import HumanMessage
+from langchain_core.messages.content import (
+    create_file_block,
+    create_image_block,
+    create_text_block,
+)
+from langchain_core.runnables import RunnableConfig
+from langgraph.types import Command
+from pydantic import BaseModel, Field
+
+from benchmark.stats import percentile
+from client.coalescing import get_coalescing_stats
+from client.http import aclose_http_clients
+from config.settings import get_settings
+from graph.orchestrator import orchestrator_graph
+from store.postgres import get_pool_stats, open_postgres
+
+GRAPH = orchestrator_graph
+DB_URI = get_settings().postgres_db_uri
+
+
+class BatchInput(BaseModel):
+    id: str | None = None
+    prompt: str
+    attachments: list[str] = Field(default_factory=list)
+
+
+class BatchResult(BaseModel):
+    index: int
+    id: str | None
+    thread_id: str
+    output: str | None
+    latency_seconds: float
+    error: str | None = None
+
+
+def _create_attachment_block(file_path: str) -> dict:
+    mime_type = magic.from_file(file_path, mime=True)
+    with open(file_path, "rb") as f:
+        base64_data = base64.b64encode(f.read()).decode("ascii")
+    if mime_type.startswith("image/"):
+        return create_image_block(base64=base64_data, mime_type=mime_type)
+    return create_file_block(base64=base64_data, mime_type=mime_type)
+
+
+async def run_row(
+    graph_compiled,
+    index: int,
+    batch_input: BatchInput,
+    user_id: str,
+    semaphore: asyncio.Semaphore,
+) -> BatchResult:
+    async with semaphore:
+        # One thread per row.
+        thread_id = str(uuid.uuid4())
+        config: RunnableConfig = {
+            "configurable": {
+                "thread_id": thread_id,
+                "context": {
+                    "user_id": user_id,
+                },
+            },
+        }
+
+        start_time = time.perf_counter()
+        try:
+            attachment_blocks = [
+                await asyncio.to_thread(_create_attachment_block, file_path)
+                for file_path in batch_input.attachments
+            ]
+            message = HumanMessage(
+                content_blocks=[
+                    create_text_block(text=batch_input.prompt),
+                    *attachment_blocks,
+                ]
+            )
+            result = await graph_compiled.ainvoke(
+                input=Command(update={"messages": [message]}),
+                config=config,
+            )
+            output, error = result.get("output"), None
+        except Exception as e:
+            output, error = None, f"{type(e).__name__}: {e}"
+
+        return BatchResult(
+            index=index,
+            id=batch_input.id,
+            thread_id=thread_id,
+            output=output,
+            latency_seconds=time.perf_counter() - start_time,
+            error=error,
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description="Run prompts from a JSONL file against the orchestrator graph.",
+    )
+    parser.add_argument(
+        "input",
+        type=Path,
+        help='JSONL file with one `{"id": ..., "prompt": ..., "attachments": [...]}` object per line',
+    )
+    parser.add_argument("output", type=Path, help="JSONL file for the results")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of rows running at the same time (default: 4)",
+    )
+    parser.add_argument("--user-id", default="1", help="User ID of the runs (default: 1)")
+    args = parser.parse_args()
+
+    with args.input.open() as f:
+        batch_inputs = [
+            BatchInput.model_validate_json(line) for line in f if line.strip()
+        ]
+
+    async with open_postgres(DB_URI) as (store, checkpointer, pool):
+        graph_compiled = GRAPH.compile(
+            checkpointer=checkpointer,
+            store=store,
+        )
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        start_time = time.perf_counter()
+        latencies: list[float] = []
+        error_count = 0
+        with args.output.open("w") as f:
+            # Write results as rows finish.
+            for task in asyncio.as_completed(
+                [
+                    run_row(graph_compiled, index, batch_input, args.user_id, semaphore)
+                    for index, batch_input in enumerate(batch_inputs)
+                ]
+            ):
+                result = await task
+                f.write(result.model_dump_json() + "\n")
+                f.flush()
+                if result.error is None:
+                    latencies.append(result.latency_seconds)
+                else:
+                    error_count += 1
+                    print(f">>> Row {result.index} failed: {result.error}")
+        total_seconds = time.perf_counter() - start_time
+
+        pool_stats = get_pool_stats(pool)
+
+    await aclose_http_clients()
+
+    print(
+        f"\n>>> {len(batch_inputs)} row(s), {error_count} failed,",
+        f"in {total_seconds:.2f} seconds",
+        f"({len(batch_inputs) / total_seconds if total_seconds > 0 else 0.0:.2f} rows/s).",
+    )
+    print(
+        ">>> Latency:",
+        f"p50={percentile(latencies, 50):.2f}s,",
+        f"p95={percentile(latencies, 95):.2f}s,",
+        f"p99={percentile(latencies, 99):.2f}s",
+    )
+    coalescing_stats = get_coalescing_stats()
+    print(
+        ">>> LLM requests:",
+        f"{coalescing_stats.coalesced} of {coalescing_stats.requests} coalesced",
+        f"({coalescing_stats.ratio:.1%})",
+    )
+    print(
+        ">>> Postgres pool:",
+        f"{pool_stats.pool_size} connection(s),",
+        f"{pool_stats.average_wait_ms:.1f}ms average wait",
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
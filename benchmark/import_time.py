@@ -0,0 +1,99 @@
+"""Cold import time of the graph entry points.
+
+Each module is imported in a fresh interpreter with `-X importtime`, so nothing
+is cached between runs. Reports the wall time of the imports and the slowest
+imported packages.
+
+Usage: `python -m benchmark.import_time --iterations 5`
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from benchmark.stats import summarize
+
+# Modules imported by `langgraph dev` (graph) and `main.py` / `batch.py`.
+DEFAULT_MODULES = ["graph.orchestrator", "main"]
+ROOT_DIR = Path(__file__).parent.parent
+
+
+def parse_import_times(output: str) -> dict[str, float]:
+    """Return the cumulative import time in seconds per top-level package from `-X importtime` output."""
+    package_times: dict[str, float] = defaultdict(float)
+    for line in output.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Only top-level imports (indented by a single space), nested ones are
+        # part of their cumulative time.
+        if name.startswith("  "):
+            continue
+        package_times[name.strip().split(".")[0]] += int(cumulative) / 1_000_000
+    return dict(package_times)
+
+
+def measure_import(module: str) -> tuple[float, dict[str, float]]:
+    """Import the module in a fresh interpreter and return the wall time and the time per package."""
+    start_time = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    seconds = time.perf_counter() - start_time
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return seconds, parse_import_times(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument(
+        "--top", type=int, default=10, help="Number of slowest packages to list"
+    )
+    parser.add_argument(
+        "--output", type=Path, default=None, help="Write the raw timings as JSON"
+    )
+    args = parser.parse_args()
+
+    results: dict[str, dict] = {}
+    for module in args.modules:
+        wall_times: list[float] = []
+        package_times: dict[str, list[float]] = defaultdict(list)
+        for _ in range(args.iterations):
+            seconds, times = measure_import(module)
+            wall_times.append(seconds)
+            for package, package_seconds in times.items():
+                package_times[package].append(package_seconds)
+        results[module] = {"wall": wall_times, "packages": package_times}
+
+        wall = summarize(wall_times)
+        print(
+            f"{module}: p50 {wall['p50'] * 1000:.0f}ms,",
+            f"mean {wall['mean'] * 1000:.0f}ms over {wall['count']} cold import(s)",
+        )
+        slowest = sorted(
+            package_times.items(),
+            key=lambda item: summarize(item[1])["p50"],
+            reverse=True,
+        )
+        for package, times in slowest[: args.top]:
+            print(f"  {package:<32} {summarize(times)['p50'] * 1000:8.1f}ms")
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
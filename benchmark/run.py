@@ -0,0 +1,267 @@
+"""End-to-end latency benchmark of the orchestrator graph against local stand-in backends.
+
+Usage: `python -m benchmark.run --iterations 5`
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+import uvicorn
+from langchain_core.messages import HumanMessage, ToolMessage
+from langchain_core.messages.content import create_file_block, create_text_block
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.store.memory import InMemoryStore
+from langgraph.types import Command
+from pydantic import BaseModel
+
+from benchmark.stats import summarize
+from benchmark.stub_servers import (
+    StubConfig,
+    create_mlx_audio_app,
+    create_mlx_lm_app,
+    create_playback_app,
+    create_silent_wav,
+)
+from client.http import aclose_http_clients
+
+
+class Scenario(BaseModel):
+    name: str
+    prompt: str
+    # Tool calls per model turn, replayed by the mlx-lm stand-in.
+    script: list[list[dict]]
+    attach_audio_seconds: float | None = None
+
+
+SCENARIOS = [
+    Scenario(
+        name="tts_dialogue",
+        prompt="Play following conversation as audio:\n- Maria: Hey Johnny. How are you?\n- Johnny: Hey Maria. I'm fine thanks, and you?\n- Maria: Me too, thanks.",
+        script=[
+            [
+                {
+                    "name": "convert_text_to_speech",
+                    "arguments": {
+                        "voice_text_parts": [
+                            {"voice": "af_heart", "text": "Hey Johnny. How are you?"},
+                            {"voice": "am_michael", "text": "Hey Maria. I'm fine thanks, and you?"},
+                            {"voice": "af_heart", "text": "Me too, thanks."},
+                        ]
+                    },
+                }
+            ],
+            [
+                {
+                    "name": "play_audio_queue",
+                    "arguments": {"queue_name": "conversation", "file_path_refs": "$TOOL_REFS"},
+                }
+            ],
+        ],
+    ),
+    Scenario(
+        name="stt_attachment",
+        prompt="Transcribe the attached audio file.",
+        script=[
+            [
+                {
+                    "name": "transcribe_audio",
+                    "arguments": {"file_path_refs": ["$ATTACHMENT_REF"]},
+                }
+            ]
+        ],
+        attach_audio_seconds=30.0,
+    ),
+    Scenario(
+        name="translate",
+        prompt="Translate 'Good morning, how did you sleep?' to German.",
+        script=[
+            [
+                {
+                    "name": "translate_text",
+                    "arguments": {
+                        "input_text": "Good morning, how did you sleep?",
+                        "output_language": "German",
+                    },
+                }
+            ]
+        ],
+    ),
+    Scenario(
+        name="stop_all",
+        prompt="Stop all music!",
+        script=[[{"name": "stop_all_audio_queues", "arguments": {}}]],
+    ),
+]
+
+
+def configure_environment(ports: dict[str, int], work_dir: Path):
+    """Point the graph at the stand-in servers and temporary output directories.
+
+    Must run before the settings are first read, as `get_settings()` reads them once.
+    """
+    os.environ["API_BASE_URL_MLX_LM"] = f"http://127.0.0.1:{ports['mlx_lm']}/v1"
+    os.environ["API_BASE_URL_MLX_AUDIO"] = f"http://127.0.0.1:{ports['mlx_audio']}/v1"
+    os.environ["API_BASE_URL_AUDIO_PLAYBACK"] = f"http://127.0.0.1:{ports['playback']}"
+    for name in ("ATTACHMENT_DIR", "BLOB_DIR", "STT_OUTPUT_DIR", "TTS_OUTPUT_DIR"):
+        os.environ[name] = str(work_dir.joinpath(name.lower()))
+    for name in ("MODEL_GENERAL", "MODEL_ORCHESTRATOR", "MODEL_STT", "MODEL_TTS"):
+        os.environ[name] = f"stub-{name.lower()}"
+    os.environ["LANGSMITH_TRACING"] = "false"
+
+
+async def start_server(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server
+
+
+async def run_scenario(graph_compiled, scenario: Scenario, timings: dict):
+    content_blocks = [
+        create_text_block(
+            text=f"{scenario.prompt}\n<stub_script>{json.dumps(scenario.script)}</stub_script>"
+        )
+    ]
+    if scenario.attach_audio_seconds is not None:
+        content_blocks.append(
+            create_file_block(
+                base64=base64.b64encode(
+                    create_silent_wav(scenario.attach_audio_seconds)
+                ).decode("ascii"),
+                mime_type="audio/wav",
+            )
+        )
+
+    config = {
+        "configurable": {
+            "thread_id": str(uuid.uuid4()),
+            "context": {"user_id": "benchmark"},
+        }
+    }
+
+    task_start_times: dict[str, float] = {}
+    state: dict = {}
+    start_time = time.perf_counter()
+    async for mode, chunk in graph_compiled.astream(
+        input=Command(update={"messages": [HumanMessage(content_blocks=content_blocks)]}),
+        config=config,
+        stream_mode=["tasks", "values"],
+    ):
+        if mode == "values":
+            state = chunk
+        elif "result" in chunk or "error" in chunk:
+            timings["nodes"][chunk["name"]].append(
+                time.perf_counter() - task_start_times.pop(chunk["id"])
+            )
+        else:
+            task_start_times[chunk["id"]] = time.perf_counter()
+    timings["total"].append(time.perf_counter() - start_time)
+
+    # Per-tool timings are recorded by the tool scheduler on the tool messages.
+    for message in state.get("messages", []):
+        if isinstance(message, ToolMessage) and "run_seconds" in message.response_metadata:
+            timings["tools"][message.name].append(message.response_metadata["run_seconds"])
+            timings["tool_queue_wait"][message.name].append(
+                message.response_metadata["queue_wait_seconds"]
+            )
+
+
+def print_report(results: dict[str, dict]):
+    def _line(label: str, values: list[float]) -> str:
+        summary = summarize(values)
+        return (
+            f"  {label:<32} n={summary['count']:<4} mean={summary['mean'] * 1000:8.1f}ms"
+            f"  p50={summary['p50'] * 1000:8.1f}ms  p95={summary['p95'] * 1000:8.1f}ms"
+        )
+
+    for scenario_name, timings in results.items():
+        print(f"\n{scenario_name}")
+        print(_line("end-to-end", timings["total"]))
+        for node_name, values in sorted(timings["nodes"].items()):
+            print(_line(f"node {node_name}", values))
+        for tool_name, values in sorted(timings["tools"].items()):
+            print(_line(f"tool {tool_name}", values))
+            print(_line(f"tool {tool_name} (queue wait)", timings["tool_queue_wait"][tool_name]))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument(
+        "--scenarios",
+        nargs="*",
+        choices=[scenario.name for scenario in SCENARIOS],
+        help="Scenarios to run (default: all)",
+    )
+    parser.add_argument("--base-port", type=int, default=18000)
+    parser.add_argument("--output", type=Path, help="Write the raw timings as JSON")
+    for field_name, field in StubConfig.model_fields.items():
+        parser.add_argument(
+            f"--{field_name.replace('_', '-')}",
+            type=float,
+            default=field.default,
+            help=f"Stand-in setting (default: {field.default})",
+        )
+    args = parser.parse_args()
+
+    stub_config = StubConfig(
+        **{name: getattr(args, name) for name in StubConfig.model_fields}
+    )
+    ports = {
+        "mlx_lm": args.base_port,
+        "mlx_audio": args.base_port + 1,
+        "playback": args.base_port + 2,
+    }
+
+    with tempfile.TemporaryDirectory(prefix="locallm-benchmark-") as work_dir:
+        configure_environment(ports, Path(work_dir))
+        # Import after configuring the environment (the graph reads the settings on import).
+        from graph.orchestrator import orchestrator_graph
+
+        servers = [
+            await start_server(create_mlx_lm_app(stub_config), ports["mlx_lm"]),
+            await start_server(create_mlx_audio_app(stub_config), ports["mlx_audio"]),
+            await start_server(create_playback_app(stub_config), ports["playback"]),
+        ]
+
+        graph_compiled = orchestrator_graph.compile(
+            checkpointer=InMemorySaver(),
+            store=InMemoryStore(),
+        )
+
+        results: dict[str, dict] = {}
+        for scenario in SCENARIOS:
+            if args.scenarios and scenario.name not in args.scenarios:
+                continue
+            timings = {
+                "total": [],
+                "nodes": defaultdict(list),
+                "tools": defaultdict(list),
+                "tool_queue_wait": defaultdict(list),
+            }
+            for _ in range(args.iterations):
+                await run_scenario(graph_compiled, scenario, timings)
+            results[scenario.name] = timings
+
+        await aclose_http_clients()
+        for server in servers:
+            server.should_exit = True
+
+    print_report(results)
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
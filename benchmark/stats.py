@@ -0,0 +1,22 @@
+import math
+import statistics
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Return the nearest-rank percentile of the values."""
+    if not values:
+        return 0.0
+    sorted_values = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    """Return count, mean and p50/p95/p99 of the values."""
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }
@@ -0,0 +1,363 @@
+"""Deterministic local stand-ins for the mlx-lm, mlx-audio and audio playback servers.
+
+The stand-ins follow the APIs used by the graph closely enough to run it
+end to end on any machine, with configurable latencies and token rates.
+
+The chat endpoint does not generate anything. It replays a script embedded
+in the last user message as `<stub_script>[[tool calls of step 1], ...]</stub_script>`:
+step `n` is answered after the `n`-th model turn of the user message, and a
+final text answer follows the last step. Tool call arguments can contain
+`$ATTACHMENT_REF` (the last attachment reference of the user message) and
+`$LAST_REF` (the last reference returned by a tool since the user message);
+an argument that is exactly `$TOOL_REFS` becomes the list of all of them.
+"""
+
+import asyncio
+import io
+import json
+import re
+import time
+import uuid
+import wave
+
+from fastapi import FastAPI, HTTPException, Request, UploadFile
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+
+STUB_SCRIPT_PATTERN = re.compile(r"<stub_script>(.*?)</stub_script>", re.DOTALL)
+ATTACHMENT_REF_PATTERN = re.compile(r"File path reference: (REF_\d+)")
+REF_PATTERN = re.compile(r"REF_\d+")
+INPUT_TEXT_PATTERN = re.compile(r"<input_text>(.*?)</input_text>", re.DOTALL)
+OUTPUT_LANGUAGE_PATTERN = re.compile(r"<output_language>(.*?)</output_language>", re.DOTALL)
+CHARS_PER_TOKEN = 4
+TTS_SAMPLE_RATE = 24000
+
+
+class StubConfig(BaseModel):
+    # mlx-lm
+    llm_latency: float = 0.05
+    llm_prefill_tokens_per_second: float = 2000.0
+    llm_tokens_per_second: float = 50.0
+    # mlx-audio
+    tts_latency: float = 0.1
+    tts_seconds_per_character: float = 0.002
+    stt_latency: float = 0.1
+    stt_bytes_per_second: float = 5_000_000.0
+    # Audio playback
+    playback_latency: float = 0.005
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(
+            block.get("text", "") for block in content if isinstance(block, dict)
+        )
+    return ""
+
+
+def _replace_placeholders(value, replacements: dict[str, str | list[str]]):
+    if isinstance(value, str):
+        if isinstance(replacements.get(value), list):
+            return replacements[value]
+        for placeholder, replacement in replacements.items():
+            if isinstance(replacement, list):
+                continue
+            value = value.replace(placeholder, replacement)
+        return value
+    if isinstance(value, list):
+        return [_replace_placeholders(item, replacements) for item in value]
+    if isinstance(value, dict):
+        return {k: _replace_placeholders(v, replacements) for k, v in value.items()}
+    return value
+
+
+def plan_response(messages: list[dict]) -> tuple[str, list[dict]]:
+    """Return the text and tool calls answering the chat messages."""
+    system_text = _message_text(messages[0]) if messages else ""
+
+    # Requests of `translate_text`.
+    if system_text.startswith("Translate the text"):
+        prompt = _message_text(messages[-1])
+        input_text = INPUT_TEXT_PATTERN.search(prompt)
+        output_language = OUTPUT_LANGUAGE_PATTERN.search(prompt)
+        return (
+            f"[{output_language.group(1) if output_language else '?'}] "
+            f"{input_text.group(1) if input_text else prompt}",
+            [],
+        )
+
+    last_user_index = max(
+        (i for i, m in enumerate(messages) if m.get("role") == "user"), default=None
+    )
+    if last_user_index is None:
+        return "OK.", []
+
+    user_text = _message_text(messages[last_user_index])
+    script_match = STUB_SCRIPT_PATTERN.search(user_text)
+    if script_match is None:
+        return "OK.", []
+
+    steps: list[list[dict]] = json.loads(script_match.group(1))
+    later_messages = messages[last_user_index + 1 :]
+    step = sum(1 for m in later_messages if m.get("role") == "assistant")
+    if step >= len(steps):
+        return "Done.", []
+
+    attachment_refs = ATTACHMENT_REF_PATTERN.findall(user_text)
+    tool_refs = [
+        ref
+        for m in later_messages
+        if m.get("role") == "tool"
+        for ref in REF_PATTERN.findall(_message_text(m))
+    ]
+    replacements = {
+        "$ATTACHMENT_REF": attachment_refs[-1] if attachment_refs else "REF_0",
+        "$LAST_REF": tool_refs[-1] if tool_refs else "REF_0",
+        "$TOOL_REFS": list(dict.fromkeys(tool_refs)),
+    }
+    return "", [
+        {
+            "name": tool_call["name"],
+            "arguments": _replace_placeholders(tool_call.get("arguments", {}), replacements),
+        }
+        for tool_call in steps[step]
+    ]
+
+
+def create_mlx_lm_app(config: StubConfig) -> FastAPI:
+    app = FastAPI(title="mlx-lm stand-in")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", "stub")
+        prompt_tokens = len(json.dumps(messages)) // CHARS_PER_TOKEN
+        text, tool_calls = plan_response(messages)
+        completion_tokens = (
+            len(text) + len(json.dumps(tool_calls))
+        ) // CHARS_PER_TOKEN + 1
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        openai_tool_calls = [
+            {
+                "index": index,
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {
+                    "name": tool_call["name"],
+                    "arguments": json.dumps(tool_call["arguments"]),
+                },
+            }
+            for index, tool_call in enumerate(tool_calls)
+        ]
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        # Latency and prefill.
+        await asyncio.sleep(
+            config.llm_latency + prompt_tokens / config.llm_prefill_tokens_per_second
+        )
+
+        if not body.get("stream"):
+            await asyncio.sleep(completion_tokens / config.llm_tokens_per_second)
+            message = {"role": "assistant", "content": text}
+            if openai_tool_calls:
+                message["tool_calls"] = [
+                    {k: v for k, v in tool_call.items() if k != "index"}
+                    for tool_call in openai_tool_calls
+                ]
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {"index": 0, "message": message, "finish_reason": finish_reason}
+                ],
+                "usage": usage,
+            }
+
+        def _chunk(delta: dict, finish: str | None = None) -> str:
+            return "data: " + json.dumps(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {"index": 0, "delta": delta, "finish_reason": finish}
+                    ],
+                }
+            ) + "\n\n"
+
+        async def _stream():
+            yield _chunk({"role": "assistant", "content": ""})
+            for word in re.findall(r"\S+\s*", text):
+                await asyncio.sleep(
+                    max(1, len(word) // CHARS_PER_TOKEN) / config.llm_tokens_per_second
+                )
+                yield _chunk({"content": word})
+            for tool_call in openai_tool_calls:
+                # Tool calls are emitted once complete, like the mlx-lm server does.
+                await asyncio.sleep(
+                    len(tool_call["function"]["arguments"])
+                    / CHARS_PER_TOKEN
+                    / config.llm_tokens_per_second
+                )
+                yield _chunk({"tool_calls": [tool_call]})
+            yield _chunk({}, finish_reason)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield "data: " + json.dumps(
+                    {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": model,
+                        "choices": [],
+                        "usage": usage,
+                    }
+                ) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(_stream(), media_type="text/event-stream")
+
+    return app
+
+
+def create_silent_wav(seconds: float, sample_rate: int = TTS_SAMPLE_RATE) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(b"\x00\x00" * int(seconds * sample_rate))
+    return buffer.getvalue()
+
+
+def create_mlx_audio_app(config: StubConfig) -> FastAPI:
+    app = FastAPI(title="mlx-audio stand-in")
+
+    @app.post("/v1/audio/speech")
+    async def speech(request: Request):
+        body = await request.json()
+        text = body.get("input", "")
+        await asyncio.sleep(
+            config.tts_latency + len(text) * config.tts_seconds_per_character
+        )
+        # Roughly the duration of spoken text.
+        return Response(
+            content=create_silent_wav(len(text) * 0.06),
+            media_type="audio/wav",
+        )
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions(file: UploadFile):
+        content = await file.read()
+        await asyncio.sleep(
+            config.stt_latency + len(content) / config.stt_bytes_per_second
+        )
+        return {"text": f"Transcription of {len(content)} bytes.", "language": "en"}
+
+    return app
+
+
+def create_playback_app(config: StubConfig) -> FastAPI:
+    app = FastAPI(title="Audio playback stand-in")
+    queues: dict[str, dict] = {}
+
+    def _status(queue: dict) -> dict:
+        return {
+            "name": queue["name"],
+            "volume": queue["volume"],
+            "current_file": queue["files"][0] if queue["files"] else None,
+            "current_position": 0.0,
+            "current_duration": 0.0,
+            "remaining_files": queue["files"][1:],
+            "is_playing": bool(queue["files"]),
+        }
+
+    def _get_queue(name: str) -> dict:
+        if name not in queues:
+            raise HTTPException(status_code=404, detail=f"Queue '{name}' not found")
+        return queues[name]
+
+    @app.get("/queues")
+    async def list_queues():
+        await asyncio.sleep(config.playback_latency)
+        return [
+            {
+                "name": q["name"],
+                "volume": q["volume"],
+                "is_playing": bool(q["files"]),
+                "file_count": len(q["files"]),
+            }
+            for q in queues.values()
+        ]
+
+    @app.post("/queues/{name}")
+    async def play(name: str, request: Request):
+        await asyncio.sleep(config.playback_latency)
+        body = await request.json()
+        queue = queues.setdefault(name, {"name": name, "volume": 1.0, "files": []})
+        queue["files"].extend(body.get("files", []))
+        queue["volume"] = body.get("volume", queue["volume"])
+        return _status(queue)
+
+    @app.post("/queues/{name}/stream")
+    async def stream(name: str, request: Request, volume: float | None = None):
+        await asyncio.sleep(config.playback_latency)
+        queue = queues.setdefault(name, {"name": name, "volume": 1.0, "files": []})
+        async for _ in request.stream():
+            pass
+        queue["files"].append(f"stream-{uuid.uuid4()}")
+        if volume is not None:
+            queue["volume"] = volume
+        return _status(queue)
+
+    @app.get("/queues/{name}")
+    async def status(name: str):
+        await asyncio.sleep(config.playback_latency)
+        return _status(_get_queue(name))
+
+    @app.delete("/queues")
+    async def stop_all():
+        await asyncio.sleep(config.playback_latency)
+        names = list(queues)
+        queues.clear()
+        if names:
+            return {"message": f"Stopped queues: {', '.join(names)}"}
+        return {"message": "No active queues to stop"}
+
+    @app.delete("/queues/{name}")
+    async def stop(name: str):
+        await asyncio.sleep(config.playback_latency)
+        _get_queue(name)
+        del queues[name]
+        return {"message": f"Queue '{name}' removed"}
+
+    @app.put("/queues/{name}/volume")
+    async def set_volume(name: str, request: Request):
+        await asyncio.sleep(config.playback_latency)
+        body = await request.json()
+        _get_queue(name)["volume"] = body["volume"]
+        return {"message": f"Volume set to {body['volume']}"}
+
+    @app.post("/queues/{name}/skip")
+    async def skip(name: str):
+        await asyncio.sleep(config.playback_latency)
+        queue = _get_queue(name)
+        queue["files"] = queue["files"][1:]
+        return {"message": "Track skipped"}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy", "active_queues": len(queues)}
+
+    return app
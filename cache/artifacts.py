@@ -0,0 +1,311 @@
+"""Content-addressed cache of attachments, generated speech and transcriptions.
+
+Files are stored in hash-sharded subdirectories (`<dir>/ab/abcdef...<suffix>`)
+and indexed in SQLite next to them, so lookups by content hash don't scan the
+directory. The cache is kept within a disk quota and a maximum age by evicting
+the least recently used files. Files a reference key was handed out for or
+resolved to recently (see `store.references`) are pinned: they count towards
+the quota, but are only evicted once their pin expired, so that references of
+the last `ARTIFACT_CACHE_REFERENCE_PIN_DAYS` keep working. Evicted files are
+generated (speech, transcriptions) or uploaded (attachments) again at the same
+content-addressed path, which makes older references valid again.
+"""
+
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from enum import StrEnum
+from functools import cache
+from pathlib import Path
+
+from config.settings import get_settings
+from telemetry.metrics import ARTIFACT_CACHE_BYTES
+
+INDEX_FILE_NAME = ".artifacts.sqlite"
+# `PRAGMA user_version` of indexes whose referenced files are all marked.
+REFERENCES_TRACKED_VERSION = 1
+# Files written before the index existed: `<timestamp>-<md5>[.<suffix>]`.
+LEGACY_FILE_NAME_PATTERN = re.compile(r"^\d+-(?P<hash>[0-9a-f]{32})(?P<suffix>\.\w+)?$")
+
+
+class ArtifactKind(StrEnum):
+    ATTACHMENT = "attachment"
+    STT = "stt"
+    TTS = "tts"
+
+
+class ArtifactCache:
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int | None = None,
+        max_age_seconds: float | None = None,
+        reference_pin_seconds: float | None = None,
+    ):
+        """Files referenced within `reference_pin_seconds` are kept (forever if `None`)."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.reference_pin_seconds = reference_pin_seconds
+        directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            directory.joinpath(INDEX_FILE_NAME), check_same_thread=False
+        )
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    hash TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    referenced_at REAL
+                )
+                """
+            )
+            columns = {
+                row[1]
+                for row in self._connection.execute("PRAGMA table_info(artifacts)")
+            }
+            if "referenced_at" not in columns:
+                # Indexes created before references were tracked.
+                self._connection.execute(
+                    "ALTER TABLE artifacts ADD COLUMN referenced_at REAL"
+                )
+            if "referenced" in columns:
+                # Replaced by the time of the last reference: pinned from now on.
+                self._connection.execute(
+                    "UPDATE artifacts SET referenced_at = ? WHERE referenced = 1",
+                    (time.time(),),
+                )
+                self._connection.execute("ALTER TABLE artifacts DROP COLUMN referenced")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS artifacts_last_used_at ON artifacts (last_used_at)"
+            )
+            is_empty = (
+                self._connection.execute("SELECT 1 FROM artifacts LIMIT 1").fetchone()
+                is None
+            )
+        if is_empty:
+            self._index_legacy_files()
+            if self._count() == 0:
+                # Nothing indexed yet, so no reference can point to an unmarked file.
+                self.mark_references_tracked()
+
+    def _index_legacy_files(self):
+        """Index the files of the flat directory layout once, in place, so existing references stay valid."""
+        rows = []
+        for entry in os.scandir(self.directory):
+            match = LEGACY_FILE_NAME_PATTERN.match(entry.name)
+            if match is None or not entry.is_file():
+                continue
+            stat = entry.stat()
+            rows.append(
+                (match["hash"], entry.path, stat.st_size, stat.st_mtime, stat.st_mtime)
+            )
+        if rows:
+            with self._lock, self._connection:
+                self._connection.executemany(
+                    "INSERT OR IGNORE INTO artifacts (hash, path, size, created_at, last_used_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+            print(f"Indexed {len(rows)} cached file(s) in {self.directory}.")
+
+    def _count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+
+    @property
+    def references_tracked(self) -> bool:
+        """Whether the files of all stored references are marked (see `mark_referenced()`)."""
+        with self._lock:
+            user_version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        return user_version >= REFERENCES_TRACKED_VERSION
+
+    def mark_references_tracked(self):
+        with self._lock, self._connection:
+            self._connection.execute(f"PRAGMA user_version = {REFERENCES_TRACKED_VERSION}")
+
+    def mark_referenced(self, paths: list[str]):
+        """Pin the files at the paths as referenced now (other paths are ignored)."""
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "UPDATE artifacts SET referenced_at = ? WHERE path = ?",
+                [(now, path) for path in paths],
+            )
+
+    def path_for(self, digest: str, suffix: str = "") -> Path:
+        """Return the (sharded) path to store the artifact with the given hash at."""
+        path = self.directory.joinpath(digest[:2], f"{digest}{suffix}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def lookup(self, digest: str) -> Path | None:
+        """Return the path of the cached artifact with the given hash, if any."""
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT path FROM artifacts WHERE hash = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(row[0]):
+                # Removed outside of the cache.
+                self._connection.execute("DELETE FROM artifacts WHERE hash = ?", (digest,))
+                return None
+            self._connection.execute(
+                "UPDATE artifacts SET last_used_at = ? WHERE hash = ?",
+                (time.time(), digest),
+            )
+            return Path(row[0])
+
+    def add(self, digest: str, path: Path):
+        """Index a file stored at `path_for(digest)` and evict old files if needed."""
+        now = time.time()
+        with self._lock, self._connection:
+            # Keep the pin of a re-added file that is already referenced.
+            self._connection.execute(
+                """
+                INSERT INTO artifacts (hash, path, size, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (hash) DO UPDATE SET
+                    path = excluded.path,
+                    size = excluded.size,
+                    last_used_at = excluded.last_used_at
+                """,
+                (digest, str(path), path.stat().st_size, now, now),
+            )
+        # The new file is not referenced yet, but about to be.
+        self.evict(keep_digest=digest)
+
+    def evict(self, keep_digest: str | None = None):
+        """Remove files older than the maximum age, then the least recently used ones beyond the quota.
+
+        Pinned files (see `reference_pin_seconds`) and the file of
+        `keep_digest` are kept and count towards the quota. Nothing is
+        evicted until the files of references stored before they were marked
+        are marked as well (see `store.references.mark_stored_references()`).
+        """
+        if self.max_bytes is None and self.max_age_seconds is None:
+            return
+        if not self.references_tracked:
+            return
+
+        # Files referenced since then are pinned.
+        pinned_since = (
+            time.time() - self.reference_pin_seconds
+            if self.reference_pin_seconds is not None
+            else float("-inf")
+        )
+        with self._lock, self._connection:
+            total_size = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM artifacts"
+            ).fetchone()[0]
+            rows = self._connection.execute(
+                "SELECT hash, path, size, last_used_at FROM artifacts"
+                " WHERE (referenced_at IS NULL OR referenced_at < ?) AND hash IS NOT ?"
+                " ORDER BY last_used_at",
+                (pinned_since, keep_digest),
+            ).fetchall()
+            pinned_size = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM artifacts WHERE referenced_at >= ?",
+                (pinned_since,),
+            ).fetchone()[0]
+            cutoff = (
+                time.time() - self.max_age_seconds
+                if self.max_age_seconds is not None
+                else None
+            )
+
+            evicted: list[tuple[str, str]] = []
+            for digest, path, size, last_used_at in rows:
+                is_expired = cutoff is not None and last_used_at < cutoff
+                is_over_quota = self.max_bytes is not None and total_size > self.max_bytes
+                if not is_expired and not is_over_quota:
+                    # Rows are ordered by last use, so later ones are newer.
+                    break
+                evicted.append((digest, path))
+                total_size -= size
+
+            self._connection.executemany(
+                "DELETE FROM artifacts WHERE hash = ?",
+                [(digest,) for digest, _ in evicted],
+            )
+
+        for _, path in evicted:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        ARTIFACT_CACHE_BYTES.labels(directory=str(self.directory), state="total").set(
+            total_size
+        )
+        ARTIFACT_CACHE_BYTES.labels(directory=str(self.directory), state="pinned").set(
+            pinned_size
+        )
+        if evicted:
+            print(f"Evicted {len(evicted)} cached file(s) from {self.directory}.")
+        if self.max_bytes is not None and total_size > self.max_bytes:
+            print(
+                f"Cache {self.directory} over quota:",
+                f"{total_size} bytes, {pinned_size} of them pinned by references.",
+            )
+
+    async def alookup(self, digest: str) -> Path | None:
+        return await asyncio.to_thread(self.lookup, digest)
+
+    async def aadd(self, digest: str, path: Path):
+        await asyncio.to_thread(self.add, digest, path)
+
+
+def _get_directory(kind: ArtifactKind) -> Path:
+    settings = get_settings()
+    if kind == ArtifactKind.ATTACHMENT:
+        return Path(settings.attachment_dir)
+    if kind == ArtifactKind.TTS:
+        return Path(settings.tts_output_dir)
+    return Path(settings.stt_output_dir).joinpath("transcription")
+
+
+@cache
+def get_artifact_cache(kind: ArtifactKind) -> ArtifactCache:
+    """Return the cache of the kind, limited by `ARTIFACT_CACHE_MAX_BYTES` and `ARTIFACT_CACHE_MAX_AGE_DAYS`.
+
+    Referenced files are pinned for `ARTIFACT_CACHE_REFERENCE_PIN_DAYS`.
+    """
+    settings = get_settings()
+    return ArtifactCache(
+        _get_directory(kind),
+        max_bytes=settings.artifact_cache_max_bytes,
+        max_age_seconds=(
+            settings.artifact_cache_max_age_days * 24 * 60 * 60
+            if settings.artifact_cache_max_age_days is not None
+            else None
+        ),
+        reference_pin_seconds=(
+            settings.artifact_cache_reference_pin_days * 24 * 60 * 60
+            if settings.artifact_cache_reference_pin_days is not None
+            else None
+        ),
+    )
+
+
+def get_artifact_caches() -> list[ArtifactCache]:
+    return [get_artifact_cache(kind) for kind in ArtifactKind]
+
+
+async def amark_referenced_artifacts(paths: list[str]):
+    """Pin the artifacts at the paths as referenced now, in whichever cache holds them."""
+
+    def _mark_referenced():
+        for artifact_cache in get_artifact_caches():
+            artifact_cache.mark_referenced(paths)
+
+    await asyncio.to_thread(_mark_referenced)
@@ -0,0 +1,75 @@
+import asyncio
+import mmap
+import os
+import sqlite3
+import threading
+from functools import cache
+from hashlib import md5
+from pathlib import Path
+
+from config.settings import get_settings
+
+
+def hash_file(path: str) -> str:
+    """Return the MD5 hash of the file content, read through a memory map instead of into memory."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files can't be mapped.
+            return md5(b"").hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            return md5(mapped_file).hexdigest()
+
+
+class FileHashIndex:
+    """Persistent index of file content hashes by (device, inode), size and modification time.
+
+    Files whose size, modification time and inode are unchanged since they
+    were last hashed are not read again.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS file_hashes (
+                    device INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    hash TEXT NOT NULL,
+                    PRIMARY KEY (device, inode)
+                )
+                """
+            )
+
+    def hash_file(self, path: str) -> tuple[str, bool]:
+        """Return the content hash of the file and whether it was taken from the index."""
+        stat = os.stat(path)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT hash FROM file_hashes WHERE device = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+                (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+        if row is not None:
+            return row[0], True
+
+        file_hash = hash_file(path)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?)",
+                (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, file_hash),
+            )
+        return file_hash, False
+
+    async def ahash_file(self, path: str) -> tuple[str, bool]:
+        return await asyncio.to_thread(self.hash_file, path)
+
+
+@cache
+def get_file_hash_index() -> FileHashIndex:
+    """Return the file hash index, stored in `STT_OUTPUT_DIR`."""
+    return FileHashIndex(Path(get_settings().stt_output_dir).joinpath("file_hashes.sqlite"))
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from functools import cache
+from hashlib import sha256
+from pathlib import Path
+
+from config.settings import get_settings
+
+
+def normalize_text(text: str) -> str:
+    """Normalize Unicode and whitespace, keeping line breaks (they can change a translation)."""
+    text = unicodedata.normalize("NFC", text)
+    return "\n".join(" ".join(line.split()) for line in text.strip().splitlines())
+
+
+def get_translation_key(
+    model: str,
+    input_language: str | None,
+    output_language: str,
+    input_text: str,
+) -> str:
+    return sha256(
+        json.dumps(
+            [
+                model,
+                (input_language or "").strip().lower(),
+                output_language.strip().lower(),
+                normalize_text(input_text),
+            ]
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+class TranslationCache:
+    """Persistent translation cache in SQLite with least-recently-used eviction.
+
+    Holds at most `max_entries` translations; the least recently used ones are
+    evicted when new translations are added.
+    """
+
+    def __init__(self, path: Path, max_entries: int):
+        self.max_entries = max_entries
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS translations (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    input_language TEXT,
+                    output_language TEXT NOT NULL,
+                    output_text TEXT NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+                """
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS translations_last_used_at ON translations (last_used_at)"
+            )
+
+    def get(self, key: str) -> str | None:
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT output_text FROM translations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE translations SET last_used_at = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            return row[0]
+
+    def put(
+        self,
+        key: str,
+        model: str,
+        input_language: str | None,
+        output_language: str,
+        output_text: str,
+    ):
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                INSERT OR REPLACE INTO translations
+                    (key, model, input_language, output_language, output_text, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, model, input_language, output_language, output_text, time.time()),
+            )
+            self._connection.execute(
+                """
+                DELETE FROM translations WHERE key IN (
+                    SELECT key FROM translations ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    async def aget(self, key: str) -> str | None:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(
+        self,
+        key: str,
+        model: str,
+        input_language: str | None,
+        output_language: str,
+        output_text: str,
+    ):
+        await asyncio.to_thread(
+            self.put, key, model, input_language, output_language, output_text
+        )
+
+
+@cache
+def get_translation_cache() -> TranslationCache | None:
+    """Return the cache at `TRANSLATION_CACHE_PATH`, or `None` if no path is configured."""
+    settings = get_settings()
+    if settings.translation_cache_path is None:
+        return None
+    return TranslationCache(
+        Path(settings.translation_cache_path),
+        max_entries=settings.translation_cache_max_entries,
+    )
@@ -0,0 +1,69 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import StrEnum
+from functools import cache
+
+from config.settings import get_settings
+from telemetry.metrics import BACKEND_QUEUE_WAIT
+
+
+class Backend(StrEnum):
+    MLX_AUDIO = "mlx_audio"
+    MLX_LM = "mlx_lm"
+    PLAYBACK = "playback"
+    LOCAL = "local"
+
+
+# Default number of concurrent requests per backend.
+# The mlx servers process one request at a time, so more only queues up there.
+DEFAULT_BACKEND_CONCURRENCY: dict[Backend, int] = {
+    Backend.MLX_AUDIO: 1,
+    Backend.MLX_LM: 1,
+    Backend.PLAYBACK: 4,
+    Backend.LOCAL: 8,
+}
+
+# Waits for backend slots collected by `track_queue_wait()`.
+_queue_waits: ContextVar[list[float] | None] = ContextVar(
+    "backend_queue_waits", default=None
+)
+
+
+@cache
+def get_backend_semaphore(backend: Backend) -> asyncio.Semaphore:
+    """Return the semaphore capping concurrent requests to the backend (e.g. `TOOL_CONCURRENCY_MLX_AUDIO`)."""
+    concurrency = getattr(get_settings(), f"tool_concurrency_{backend}")
+    if concurrency is None:
+        concurrency = DEFAULT_BACKEND_CONCURRENCY[backend]
+    return asyncio.Semaphore(concurrency)
+
+
+@asynccontextmanager
+async def backend_slot(backend: Backend) -> AsyncIterator[None]:
+    """Hold a request slot of the backend for the block.
+
+    Shared by the tool scheduler and the requests fanned out within tool
+    calls, so the cap holds across all calls to the backend.
+    """
+    queued_time = time.perf_counter()
+    async with get_backend_semaphore(backend):
+        queue_wait_seconds = time.perf_counter() - queued_time
+        BACKEND_QUEUE_WAIT.labels(backend=str(backend)).observe(queue_wait_seconds)
+        queue_waits = _queue_waits.get()
+        if queue_waits is not None:
+            queue_waits.append(queue_wait_seconds)
+        yield
+
+
+@contextmanager
+def track_queue_wait() -> Iterator[list[float]]:
+    """Collect the waits for backend slots within the block, including tasks started in it."""
+    queue_waits: list[float] = []
+    token = _queue_waits.set(queue_waits)
+    try:
+        yield queue_waits
+    finally:
+        _queue_waits.reset(token)
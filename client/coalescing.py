@@ -0,0 +1,222 @@
+"""Coalescing of identical in-flight LLM requests.
+
+The mlx-lm server generates one response at a time, so identical requests
+(e.g. the same translation from parallel tool calls, or the same canned
+command from many clients) queue up behind each other only to generate the
+same output. While a request is in flight, identical requests join its
+stream instead of sending their own.
+"""
+
+import asyncio
+import copy
+import functools
+import json
+from collections.abc import AsyncIterator, Callable
+from hashlib import sha256
+from typing import Any
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel
+
+from client.backends import Backend, backend_slot
+from config.settings import get_settings
+from telemetry.metrics import LLM_COALESCED_REQUESTS, LLM_REQUESTS
+
+# Message fields that differ between otherwise identical requests.
+IGNORED_REQUEST_KEYS = {"id", "tool_call_id"}
+
+
+class CoalescingStats(BaseModel):
+    requests: int = 0
+    coalesced: int = 0
+
+    @property
+    def ratio(self) -> float:
+        """Share of requests served by another in-flight request."""
+        return self.coalesced / self.requests if self.requests > 0 else 0.0
+
+
+class SharedStream:
+    """Stream of one upstream generation, replayed to every subscriber from the start."""
+
+    def __init__(self, source: AsyncIterator[ChatGenerationChunk]):
+        self._chunks: list[ChatGenerationChunk] = []
+        self._error: BaseException | None = None
+        self._done = False
+        self._cancelled = False
+        self._updated = asyncio.Event()
+        self._subscribers = 0
+        self._task = asyncio.create_task(self._pump(source))
+
+    @property
+    def done(self) -> bool:
+        """Whether the generation is complete or cancelled, so it can't be joined anymore."""
+        return self._done or self._cancelled
+
+    def add_done_callback(self, callback: Callable[[], None]):
+        self._task.add_done_callback(lambda _: callback())
+
+    async def _pump(self, source: AsyncIterator[ChatGenerationChunk]):
+        try:
+            async for chunk in source:
+                self._chunks.append(chunk)
+                self._notify()
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._done = True
+            self._notify()
+
+    def _notify(self):
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[ChatGenerationChunk]:
+        """Yield copies of the chunks, so subscribers can't change each other's chunks."""
+        self._subscribers += 1
+        try:
+            index = 0
+            while True:
+                updated = self._updated
+                while index < len(self._chunks):
+                    yield copy.deepcopy(self._chunks[index])
+                    index += 1
+                if self._done:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                await updated.wait()
+        finally:
+            self._subscribers -= 1
+            # Stop generating once nobody waits for the response anymore.
+            if self._subscribers == 0 and not self._done:
+                # Marked right away: the task only finishes on its next step,
+                # and identical requests until then need a new generation.
+                self._cancelled = True
+                self._task.cancel()
+
+
+class RequestCoalescer:
+    """Shares in-flight generations between identical requests."""
+
+    def __init__(self):
+        self._in_flight: dict[str, SharedStream] = {}
+        self.stats = CoalescingStats()
+
+    def stream(
+        self,
+        key: str,
+        model_name: str,
+        create_source: Callable[[], AsyncIterator[ChatGenerationChunk]],
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """Join the in-flight generation of the key or start a new one."""
+        self.stats.requests += 1
+        LLM_REQUESTS.labels(model=model_name).inc()
+
+        shared_stream = self._in_flight.get(key)
+        if shared_stream is not None and not shared_stream.done:
+            self.stats.coalesced += 1
+            LLM_COALESCED_REQUESTS.labels(model=model_name).inc()
+        else:
+            shared_stream = SharedStream(create_source())
+            self._in_flight[key] = shared_stream
+            shared_stream.add_done_callback(lambda: self._remove(key, shared_stream))
+        return shared_stream.subscribe()
+
+    def _remove(self, key: str, shared_stream: SharedStream):
+        if self._in_flight.get(key) is shared_stream:
+            del self._in_flight[key]
+
+
+llm_coalescer = RequestCoalescer()
+
+
+def get_coalescing_stats() -> CoalescingStats:
+    return llm_coalescer.stats.model_copy()
+
+
+def _normalize(value: Any) -> Any:
+    """Drop the IDs of messages and tool calls."""
+    if isinstance(value, dict):
+        return {
+            k: _normalize(v) for k, v in value.items() if k not in IGNORED_REQUEST_KEYS
+        }
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+class CoalescingChatOpenAI(ChatOpenAI):
+    """`ChatOpenAI` sharing streamed generations between identical in-flight requests.
+
+    Requests are identical if their payloads (model, parameters, tools and
+    messages) match, ignoring message and tool call IDs. Each caller still
+    gets its own run (IDs, callbacks, tracing); only the upstream generation
+    is shared. The models stream (`streaming=True`), so `ainvoke()` goes
+    through `_astream()` as well.
+
+    With a `backend`, each upstream generation holds a request slot of it
+    (see `client.backends.backend_slot()`). Requests joining an in-flight
+    generation don't take a slot, so they never wait behind the generation
+    they share.
+    """
+
+    backend: Backend | None = None
+
+    def _coalescing_key(
+        self, messages: list[BaseMessage], stop: list[str] | None, **kwargs: Any
+    ) -> str:
+        payload = self._get_request_payload(messages, stop=stop, **kwargs)
+        payload["messages"] = _normalize(payload.get("messages"))
+        normalized = json.dumps(
+            [self.openai_api_base, payload], sort_keys=True, default=str
+        )
+        return sha256(normalized.encode("utf-8")).hexdigest()
+
+    async def _astream_upstream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """Stream a generation of the server, within a slot of the backend (if set)."""
+        if self.backend is None:
+            async for chunk in super()._astream(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            ):
+                yield chunk
+            return
+
+        async with backend_slot(self.backend):
+            async for chunk in super()._astream(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            ):
+                yield chunk
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        if not get_settings().llm_request_coalescing:
+            async for chunk in self._astream_upstream(
+                messages, stop=stop, run_manager=run_manager, **kwargs
+            ):
+                yield chunk
+            return
+
+        # The shared generation reports to no caller; callbacks are run per caller.
+        async for chunk in llm_coalescer.stream(
+            self._coalescing_key(messages, stop, **kwargs),
+            self.model_name,
+            functools.partial(self._astream_upstream, messages, stop=stop, **kwargs),
+        ):
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
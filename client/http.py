@@ -0,0 +1,140 @@
+"""Shared HTTP clients with keep-alive, timeouts and retries.
+
+One `httpx.AsyncClient` per backend is kept for the lifetime of the process
+(or until `aclose_http_clients()`), so tool calls reuse open connections
+instead of connecting for every request. The `AsyncOpenAI` clients of the
+audio tools are built on the same clients and policy.
+"""
+
+import asyncio
+from typing import TYPE_CHECKING
+
+import httpx
+
+from config.settings import get_settings
+from telemetry.metrics import HTTP_CONNECTIONS_OPENED, HTTP_REQUESTS, HTTP_RETRIES
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# Methods that can be sent again without changing the outcome.
+IDEMPOTENT_METHODS = {"DELETE", "GET", "HEAD", "OPTIONS", "PUT"}
+# Statuses of a busy or restarting backend, worth retrying for idempotent methods.
+RETRY_STATUS_CODES = {502, 503, 504}
+# Errors raised before the request reached the server, safe to retry for any method.
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# httpcore trace events of new connections.
+CONNECT_EVENTS = {
+    "connection.connect_tcp.complete",
+    "connection.connect_unix_socket.complete",
+}
+
+_http_clients: dict[str, httpx.AsyncClient] = {}
+_openai_clients: dict[str, tuple[httpx.AsyncClient, "AsyncOpenAI"]] = {}
+
+
+def get_http_timeout(read_timeout: float | None = None) -> httpx.Timeout:
+    settings = get_settings()
+    return httpx.Timeout(
+        read_timeout if read_timeout is not None else settings.http_timeout,
+        connect=settings.http_connect_timeout,
+    )
+
+
+def get_http_limits() -> httpx.Limits:
+    settings = get_settings()
+    return httpx.Limits(
+        max_connections=settings.http_max_connections,
+        max_keepalive_connections=settings.http_max_keepalive_connections,
+        keepalive_expiry=settings.http_keepalive_expiry,
+    )
+
+
+def _create_request_hook(name: str):
+    """Count the requests of the client and, through the httpcore trace extension, the connections it opens."""
+
+    async def trace(event_name: str, _: dict):
+        if event_name in CONNECT_EVENTS:
+            HTTP_CONNECTIONS_OPENED.labels(client=name).inc()
+
+    async def on_request(request: httpx.Request):
+        HTTP_REQUESTS.labels(client=name).inc()
+        request.extensions["trace"] = trace
+
+    return on_request
+
+
+def get_http_client(name: str, read_timeout: float | None = None) -> httpx.AsyncClient:
+    """Return the shared client of the backend, creating it on first use (or after it was closed)."""
+    client = _http_clients.get(name)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=get_http_timeout(read_timeout),
+            limits=get_http_limits(),
+            event_hooks={"request": [_create_request_hook(name)]},
+        )
+        _http_clients[name] = client
+    return client
+
+
+def get_openai_client(name: str, base_url: str | None) -> "AsyncOpenAI":
+    """Return an `AsyncOpenAI` client on the shared HTTP client of the backend.
+
+    Inference requests get the longer `HTTP_INFERENCE_TIMEOUT`; the OpenAI
+    client retries them itself, within the same retry budget.
+    """
+    # Imported on first use, so closing the clients on shutdown doesn't import `openai`.
+    from openai import AsyncOpenAI
+
+    settings = get_settings()
+    http_client = get_http_client(name, read_timeout=settings.http_inference_timeout)
+    if name not in _openai_clients or _openai_clients[name][0] is not http_client:
+        _openai_clients[name] = (
+            http_client,
+            AsyncOpenAI(
+                api_key="none",
+                base_url=base_url,
+                http_client=http_client,
+                max_retries=settings.http_max_retries,
+            ),
+        )
+    return _openai_clients[name][1]
+
+
+async def request(name: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """Send a request with the shared client of the backend, retrying failed attempts with exponential backoff.
+
+    Idempotent methods are retried on transport errors and gateway statuses;
+    other methods only when the connection could not be established, so a
+    request is never applied twice.
+    """
+    settings = get_settings()
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    retry_errors = httpx.TransportError if idempotent else CONNECT_ERRORS
+
+    attempt = 0
+    while True:
+        try:
+            response = await get_http_client(name).request(method, url, **kwargs)
+            if (
+                not idempotent
+                or response.status_code not in RETRY_STATUS_CODES
+                or attempt >= settings.http_max_retries
+            ):
+                return response
+            await response.aclose()
+        except retry_errors:
+            if attempt >= settings.http_max_retries:
+                raise
+
+        attempt += 1
+        HTTP_RETRIES.labels(client=name, method=method.upper()).inc()
+        await asyncio.sleep(settings.http_retry_backoff * 2 ** (attempt - 1))
+
+
+async def aclose_http_clients():
+    """Close all shared clients and their connections (e.g. on shutdown)."""
+    clients = list(_http_clients.values())
+    _http_clients.clear()
+    _openai_clients.clear()
+    await asyncio.gather(*(client.aclose() for client in clients))
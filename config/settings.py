@@ -0,0 +1,101 @@
+import os
+from functools import cache
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+
+class Settings(BaseModel):
+    """Configuration of the graph process, read from the environment (and `.env`).
+
+    Each field is set by the environment variable of the same name in upper case,
+    e.g. `model_tts` by `MODEL_TTS`.
+    """
+
+    # Servers
+    api_base_url_audio_playback: str | None = None
+    api_base_url_mlx_audio: str | None = None
+    api_base_url_mlx_lm: str | None = None
+    # Models
+    model_general: str | None = None
+    model_orchestrator: str | None = None
+    model_stt: str | None = None
+    model_tts: str | None = None
+    # Directories
+    attachment_dir: str | None = None
+    # Artifact cache (`cache.artifacts`), per directory; unlimited if unset.
+    artifact_cache_max_age_days: float | None = None
+    artifact_cache_max_bytes: int | None = None
+    # Referenced files are kept (beyond the quota and age) for this long after
+    # their last reference; forever if unset.
+    artifact_cache_reference_pin_days: float | None = 30
+    blob_dir: str | None = None
+    stt_output_dir: str | None = None
+    tts_output_dir: str | None = None
+    # Translation cache (`cache.translations`), disabled without a path.
+    translation_cache_path: str | None = None
+    translation_cache_max_entries: int = 10000
+    # Long texts are translated in chunks (`tool.language`). Chunks in flight
+    # per call; requests still wait for a `TOOL_CONCURRENCY_MLX_LM` slot,
+    # except identical ones joining an in-flight generation.
+    translation_chunk_concurrency: int = 2
+    translation_chunk_max_chars: int = 2000
+    # LLM clients (`client.coalescing`)
+    llm_request_coalescing: bool = True
+    # Orchestrator
+    orchestrator_history_token_budget: int = 16000
+    orchestrator_speculative_tool_dispatch: bool = False
+    # Checkpoints
+    checkpoint_blob_min_size: int = 64 * 1024
+    # Postgres
+    postgres_db_uri: str | None = None
+    postgres_pool_max_size: int = 10
+    postgres_pool_min_size: int = 2
+    postgres_pool_timeout: float = 30
+    postgres_prepare_threshold: int | None = 0
+    # HTTP clients (`client.http`)
+    http_connect_timeout: float = 5
+    http_inference_timeout: float = 600
+    http_keepalive_expiry: float = 30
+    http_max_connections: int = 20
+    http_max_keepalive_connections: int = 10
+    http_max_retries: int = 2
+    http_retry_backoff: float = 0.25
+    http_timeout: float = 30
+    # Files in flight per `transcribe_audio` call and parts per
+    # `convert_text_to_speech` call. Cache hits are served right away; requests
+    # still wait for a `TOOL_CONCURRENCY_MLX_AUDIO` slot, so the backend cap
+    # (1 by default) limits them further.
+    stt_concurrency: int = 2
+    tts_concurrency: int = 2
+    # Silence between the parts of a combined dialogue.
+    tts_dialogue_pause_seconds: float = 0.3
+    # Split parts longer than this into sentences, generated and cached separately.
+    tts_sentence_split_min_chars: int = 200
+    tts_sentence_splitting: bool = True
+    # Stream speech into the playback queue as it is generated, instead of
+    # queueing each part once its file is complete.
+    tts_stream_playback: bool = True
+    # Concurrent requests per backend, across all tool calls (defaults in
+    # `client.backends`). They cap the per-call concurrency settings above.
+    tool_concurrency_local: int | None = None
+    tool_concurrency_mlx_audio: int | None = None
+    tool_concurrency_mlx_lm: int | None = None
+    tool_concurrency_playback: int | None = None
+    # Metrics
+    graph_metrics_host: str = "127.0.0.1"
+    graph_metrics_port: int | None = None
+
+
+@cache
+def get_settings() -> Settings:
+    """Load `.env` (without overriding the environment) and read the settings, once per process."""
+    load_dotenv()
+    return Settings.model_validate(
+        {
+            name: value
+            for name in Settings.model_fields
+            # Empty values fall back to the default.
+            if (value := os.getenv(name.upper()))
+        }
+    )
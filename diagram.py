@@ -0,0 +1,65 @@
+import argparse
+from hashlib import sha256
+from pathlib import Path
+
+from graph.orchestrator import orchestrator_graph
+
+GRAPH = orchestrator_graph
+
+
+def render_diagram(output_path: Path, force: bool = False) -> bool:
+    """Render the graph diagram locally, unless the graph structure did not change.
+
+    `.png` files are rendered with Graphviz (requires `pygraphviz`), any other
+    extension (e.g. `.mmd`) gets the Mermaid source. Returns whether the file
+    was (re-)rendered.
+    """
+    graph = GRAPH.compile().get_graph()
+
+    # The Mermaid source describes the full graph structure, so its hash
+    # identifies the structure the diagram was rendered from.
+    mermaid = graph.draw_mermaid()
+    graph_hash = sha256(mermaid.encode("utf-8")).hexdigest()
+    hash_path = output_path.with_name(f".{output_path.name}.sha256")
+    if (
+        not force
+        and output_path.exists()
+        and hash_path.exists()
+        and hash_path.read_text().strip() == graph_hash
+    ):
+        return False
+
+    if output_path.suffix == ".png":
+        image_bytes = graph.draw_png()
+    else:
+        image_bytes = mermaid.encode("utf-8")
+
+    output_path.write_bytes(image_bytes)
+    hash_path.write_text(graph_hash)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the orchestrator graph diagram.")
+    parser.add_argument(
+        "output",
+        nargs="?",
+        default="graph.png",
+        help="Output file; `.png` renders with Graphviz, other extensions write Mermaid source (default: graph.png)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Render even if the graph structure did not change",
+    )
+    args = parser.parse_args()
+
+    output_path = Path(args.output)
+    if render_diagram(output_path, force=args.force):
+        print(f"Rendered graph diagram to {output_path}.")
+    else:
+        print(f"Graph diagram {output_path} is up to date.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import asyncio
+import binascii
+import os
+import tempfile
+import time
+from hashlib import md5
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from cache.artifacts import ArtifactCache, ArtifactKind, get_artifact_cache
+from telemetry.metrics import record_cache_lookup
+
+# Number of base64 characters decoded per chunk (a multiple of 4).
+ATTACHMENT_CHUNK_SIZE = 4 * 1024 * 1024
+# Characters allowed in (line-wrapped) base64 payloads that are not part of the alphabet.
+BASE64_WHITESPACE = b" \t\r\n"
+
+
+class AttachmentIngestion(BaseModel):
+    file_path: str
+    hash: str
+    size: int
+    reused: bool
+    seconds: float
+
+    @property
+    def bytes_per_second(self) -> float:
+        """Sustained decode, hash and write throughput of the ingestion."""
+        return self.size / self.seconds if self.seconds > 0 else float(self.size)
+
+
+def _ingest_attachment(
+    base64_data: str, artifact_cache: ArtifactCache
+) -> AttachmentIngestion:
+    """Decode, hash and write a base64 payload chunk by chunk (blocking)."""
+    start_time = time.perf_counter()
+
+    digest = md5()
+    size = 0
+    # Write to a temporary file in the same directory so the final rename is atomic.
+    file_descriptor, temp_file_path = tempfile.mkstemp(
+        dir=artifact_cache.directory, prefix=".ingest-"
+    )
+    try:
+        with os.fdopen(file_descriptor, "wb") as f:
+            remainder = b""
+            for offset in range(0, len(base64_data), ATTACHMENT_CHUNK_SIZE):
+                chunk = remainder + base64_data[
+                    offset : offset + ATTACHMENT_CHUNK_SIZE
+                ].encode("ascii").translate(None, BASE64_WHITESPACE)
+                # Only decode complete 4-character groups; carry the rest over.
+                usable = len(chunk) - len(chunk) % 4
+                remainder = chunk[usable:]
+                decoded = binascii.a2b_base64(chunk[:usable])
+                digest.update(decoded)
+                f.write(decoded)
+                size += len(decoded)
+            if remainder:
+                # Tolerate payloads with stripped padding.
+                decoded = binascii.a2b_base64(remainder + b"=" * (-len(remainder) % 4))
+                digest.update(decoded)
+                f.write(decoded)
+                size += len(decoded)
+
+        # Allow re-use of attached files.
+        attachment_hash = digest.hexdigest()
+        file_path = artifact_cache.lookup(attachment_hash)
+        reused = file_path is not None
+        if reused:
+            os.remove(temp_file_path)
+        else:
+            file_path = artifact_cache.path_for(attachment_hash)
+            os.replace(temp_file_path, file_path)
+            artifact_cache.add(attachment_hash, file_path)
+    except BaseException:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+        raise
+
+    return AttachmentIngestion(
+        file_path=str(file_path),
+        hash=attachment_hash,
+        size=size,
+        reused=reused,
+        seconds=time.perf_counter() - start_time,
+    )
+
+
+async def ingest_attachment(base64_data: str) -> AttachmentIngestion:
+    """Ingest a base64 attachment on a worker thread so the event loop keeps serving other runs."""
+    ingestion = await asyncio.to_thread(
+        _ingest_attachment, base64_data, get_artifact_cache(ArtifactKind.ATTACHMENT)
+    )
+    record_cache_lookup("attachment", ingestion.reused)
+
+    if ingestion.reused:
+        print("Using already attached file:", Path(ingestion.file_path).name)
+    else:
+        print(
+            "Ingested attached file:",
+            Path(ingestion.file_path).name,
+            f"({ingestion.size} bytes in {ingestion.seconds:.3f}s,",
+            f"{ingestion.bytes_per_second / 1_000_000:.1f} MB/s)",
+        )
+
+    return ingestion
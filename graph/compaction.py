@@ -0,0 +1,134 @@
+import json
+from collections.abc import Awaitable, Callable
+
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, ToolMessage
+
+from config.settings import get_settings
+from graph.models import HistorySummary
+from graph.utils import strip_thinking
+
+# Rough characters per token of the local models, used to estimate prompt sizes
+# without loading the tokenizer.
+CHARS_PER_TOKEN = 4
+# Tokens added per message by the chat template (role markers etc.).
+MESSAGE_TOKEN_OVERHEAD = 4
+
+Summarizer = Callable[[str | None, list[AnyMessage]], Awaitable[str]]
+
+
+def get_history_token_budget() -> int:
+    return get_settings().orchestrator_history_token_budget
+
+
+def count_tokens(message: AnyMessage) -> int:
+    """Estimate the number of prompt tokens of a message."""
+    characters = len(message.text)
+    if isinstance(message, AIMessage) and message.tool_calls:
+        characters += len(json.dumps(message.tool_calls))
+    return characters // CHARS_PER_TOKEN + MESSAGE_TOKEN_OVERHEAD
+
+
+def format_messages(messages: list[AnyMessage]) -> str:
+    """Format messages as plain text for summarization."""
+    lines: list[str] = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            lines.append(f"User: {message.text.strip()}")
+        elif isinstance(message, AIMessage):
+            non_thinking_content = strip_thinking(message.text)
+            if len(non_thinking_content) > 0:
+                lines.append(f"Assistant: {non_thinking_content}")
+            for tool_call in message.tool_calls:
+                lines.append(
+                    f"Assistant tool call: {tool_call['name']} {json.dumps(tool_call['args'])}"
+                )
+        elif isinstance(message, ToolMessage):
+            lines.append(f"Tool result ({message.status}): {message.text.strip()}")
+    return "\n".join(lines)
+
+
+def _split_groups(messages: list[AnyMessage]) -> list[list[AnyMessage]]:
+    """Split messages into groups, each starting with a user or an AI message.
+
+    A group of an AI message holds the tool messages of its tool calls, so
+    compacting whole groups never separates tool calls from their tool
+    messages, while the older model/tool steps of a single long turn can still
+    be compacted.
+    """
+    groups: list[list[AnyMessage]] = []
+    for message in messages:
+        if isinstance(message, (HumanMessage, AIMessage)) or not groups:
+            groups.append([message])
+        else:
+            groups[-1].append(message)
+    return groups
+
+
+def _count_group_tokens(groups: list[list[AnyMessage]]) -> int:
+    return sum(count_tokens(message) for group in groups for message in group)
+
+
+async def compact_history(
+    messages: list[AnyMessage],
+    history_summary: HistorySummary | None,
+    token_budget: int,
+    summarize: Summarizer,
+) -> tuple[list[AnyMessage], HistorySummary | None]:
+    """Keep the recent messages verbatim and collapse older ones into a summary.
+
+    Messages are compacted in whole groups (see `_split_groups()`), so this
+    also applies to the tool chatter of a single long user request. The
+    summary is memoized in the state: it is reused as long as the messages
+    after it fit into the budget and only extended with newly compacted groups
+    otherwise. Compaction keeps the recent groups within half of the budget, so
+    the following turns can reuse the summary again.
+    """
+    # Reuse the summary if its boundary is still valid and the rest fits.
+    summarized_count = 0
+    if (
+        history_summary is not None
+        and 0 < history_summary["message_count"] <= len(messages)
+        and messages[history_summary["message_count"] - 1].id
+        == history_summary["last_message_id"]
+    ):
+        summarized_count = history_summary["message_count"]
+    else:
+        history_summary = None
+
+    groups = _split_groups(messages[summarized_count:])
+    if _count_group_tokens(groups) > token_budget and len(groups) > 1:
+        # Keep the newest groups within half of the budget, at least the last one.
+        kept_group_count = 1
+        while (
+            kept_group_count < len(groups)
+            and _count_group_tokens(groups[-(kept_group_count + 1) :])
+            <= token_budget // 2
+        ):
+            kept_group_count += 1
+
+        compacted_messages = [
+            message for group in groups[:-kept_group_count] for message in group
+        ]
+        summary_text = await summarize(
+            history_summary["text"] if history_summary is not None else None,
+            compacted_messages,
+        )
+        summarized_count += len(compacted_messages)
+        history_summary = HistorySummary(
+            last_message_id=messages[summarized_count - 1].id,
+            message_count=summarized_count,
+            text=summary_text,
+        )
+        print(
+            "Compacted history:",
+            f"{summarized_count} message(s) summarized,",
+            f"{len(messages) - summarized_count} kept",
+        )
+
+    if history_summary is None:
+        return messages, None
+
+    summary_message = HumanMessage(
+        content=f"<conversation_summary>\n{history_summary['text']}\n</conversation_summary>"
+    )
+    return [summary_message, *messages[summarized_count:]], history_summary
@@ -5,8 +5,20 @@ from langchain.agents.middleware.types import OmitFromInput
 from langgraph.graph import MessagesState
 
 
+class HistorySummary(TypedDict):
+    # ID of the last message covered by the summary.
+    last_message_id: str
+    # Number of messages from the start of the thread covered by the summary.
+    message_count: int
+    text: str
+
+
 class OrchestratorState(MessagesState):
     todos: Annotated[NotRequired[list[Todo]], OmitFromInput]
+    # Number of attachments normalized to text references in this thread.
+    attachment_count: Annotated[NotRequired[int], OmitFromInput]
+    # Memoized summary of the compacted start of the thread.
+    history_summary: Annotated[NotRequired[HistorySummary | None], OmitFromInput]
 
 
 class OrchestratorOutputState(TypedDict):
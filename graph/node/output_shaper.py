@@ -3,8 +3,10 @@ from langgraph.graph import MessagesState
 from langgraph.types import Command
 
 from graph.utils import strip_thinking
+from telemetry.metrics import timed_node
 
 
+@timed_node("output")
 def output_shaper(state: MessagesState) -> Command:
     """For a clean output of the graph, list all AI messages and tool calls to have an overview of what happened."""
     output_lines: list[str] = []
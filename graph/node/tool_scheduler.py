@@ -0,0 +1,177 @@
+import asyncio
+import time
+from functools import cache
+
+from langchain_core.messages import AIMessage, AnyMessage, ToolCall, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import MessagesState
+from langgraph.prebuilt import ToolNode
+from langgraph.types import Command
+
+from client.backends import Backend, backend_slot, track_queue_wait
+from graph.speculation import speculative_dispatcher
+from graph.tools import get_tools
+from store.blobs import arestore_messages
+from telemetry.metrics import (
+    TOOL_DURATION,
+    TOOL_ERRORS,
+    TOOL_QUEUE_WAIT,
+    observe,
+    timed_node,
+)
+
+
+# Backend hit by each tool.
+TOOL_BACKENDS: dict[str, Backend] = {
+    "convert_text_to_speech": Backend.MLX_AUDIO,
+    "transcribe_audio": Backend.MLX_AUDIO,
+    "translate_text": Backend.MLX_LM,
+    "get_audio_queue_status": Backend.PLAYBACK,
+    "list_audio_queues": Backend.PLAYBACK,
+    "play_audio_queue": Backend.PLAYBACK,
+    "set_audio_volume": Backend.PLAYBACK,
+    "skip_audio_track": Backend.PLAYBACK,
+    "stop_all_audio_queues": Backend.PLAYBACK,
+    "stop_audio_queue": Backend.PLAYBACK,
+    "get_mime_type": Backend.LOCAL,
+    "read_file": Backend.LOCAL,
+    "sleep": Backend.LOCAL,
+}
+
+# Playback tools acting on all queues instead of a single named one.
+PLAYBACK_BARRIER_TOOLS = {"list_audio_queues", "stop_all_audio_queues"}
+
+
+@cache
+def get_tool_node() -> ToolNode:
+    return ToolNode(tools=get_tools(), handle_tool_errors=False)
+
+
+async def _invoke_tool_call(tool_call: ToolCall, config: RunnableConfig):
+    return await get_tool_node().ainvoke(
+        input={"messages": [AIMessage(content="", tool_calls=[tool_call])]},
+        config=config,
+    )
+
+
+async def run_tool_call(tool_call: ToolCall, config: RunnableConfig) -> list[AnyMessage]:
+    """Run a single tool call within the concurrency limit of its backend and return its messages.
+
+    Local tool calls hold a slot of the backend while they run. Tools of the
+    other backends hold a slot per request they send (see
+    `client.backends.backend_slot()`), as a single call can fan out into
+    several requests.
+    """
+    backend = TOOL_BACKENDS.get(tool_call["name"], Backend.LOCAL)
+
+    labels = {"tool": tool_call["name"], "backend": str(backend)}
+    start_time = time.perf_counter()
+    with track_queue_wait() as queue_waits, observe(
+        TOOL_DURATION, TOOL_ERRORS, **labels
+    ):
+        if backend == Backend.LOCAL:
+            async with backend_slot(backend):
+                result = await _invoke_tool_call(tool_call, config)
+        else:
+            result = await _invoke_tool_call(tool_call, config)
+    end_time = time.perf_counter()
+
+    queue_wait_seconds = sum(queue_waits)
+    TOOL_QUEUE_WAIT.labels(**labels).observe(queue_wait_seconds)
+    run_seconds = end_time - start_time
+    print(
+        f"Tool call {tool_call['name']} ({backend}):",
+        f"waited {queue_wait_seconds:.3f}s, ran {run_seconds:.3f}s",
+    )
+
+    messages: list[AnyMessage] = []
+    for output in result if isinstance(result, list) else [result]:
+        if isinstance(output, Command):
+            messages.extend(output.update["messages"])
+        else:
+            messages.extend(output["messages"])
+
+    # Expose the queue wait and run time on the tool message.
+    for message in messages:
+        if isinstance(message, ToolMessage):
+            message.response_metadata["backend"] = str(backend)
+            message.response_metadata["queue_wait_seconds"] = queue_wait_seconds
+            message.response_metadata["run_seconds"] = run_seconds
+    return messages
+
+
+def _is_playback_call(tool_call: ToolCall) -> bool:
+    """Whether the tool call acts on playback queues (including TTS handing its parts to a queue)."""
+    return TOOL_BACKENDS.get(tool_call["name"]) == Backend.PLAYBACK or bool(
+        tool_call["args"].get("playback_queue_name")
+    )
+
+
+def _get_playback_queue_name(tool_call: ToolCall) -> str | None:
+    return tool_call["args"].get("queue_name") or tool_call["args"].get(
+        "playback_queue_name"
+    )
+
+
+async def _run_after(
+    dependencies: list[asyncio.Task],
+    tool_call: ToolCall,
+    config: RunnableConfig,
+) -> list[AnyMessage]:
+    """Run the tool call once the tool calls it depends on are done."""
+    if dependencies:
+        await asyncio.wait(dependencies)
+    return await run_tool_call(tool_call, config)
+
+
+@timed_node("tools")
+async def tool_scheduler(
+    state: MessagesState,
+    config: RunnableConfig,
+) -> Command:
+    """Schedule the tool calls of the last AI message.
+
+    Tool calls run concurrently within the limit of their backend. Playback
+    calls on the same queue run in the given order, and calls acting on all
+    queues wait for the preceding playback calls (and vice versa). Tool calls
+    already started while the model was streaming are taken over.
+    """
+    # Checkpoints read back keep large arguments as blob references.
+    [last_message] = await arestore_messages(state["messages"][-1:])
+    tool_calls: list[ToolCall] = last_message.tool_calls
+
+    tasks: list[asyncio.Task[list[AnyMessage]]] = []
+    last_queue_tasks: dict[str, asyncio.Task] = {}
+    last_barrier_task: asyncio.Task | None = None
+    for tool_call in tool_calls:
+        task = speculative_dispatcher.pop(config, tool_call["id"])
+        if task is None:
+            dependencies: list[asyncio.Task] = []
+            if _is_playback_call(tool_call):
+                if tool_call["name"] in PLAYBACK_BARRIER_TOOLS:
+                    dependencies = list(last_queue_tasks.values())
+                    if last_barrier_task is not None and not dependencies:
+                        dependencies = [last_barrier_task]
+                else:
+                    queue_name = _get_playback_queue_name(tool_call)
+                    if queue_name in last_queue_tasks:
+                        dependencies = [last_queue_tasks[queue_name]]
+                    elif last_barrier_task is not None:
+                        dependencies = [last_barrier_task]
+
+            task = asyncio.create_task(_run_after(dependencies, tool_call, config))
+
+            if _is_playback_call(tool_call):
+                if tool_call["name"] in PLAYBACK_BARRIER_TOOLS:
+                    last_barrier_task = task
+                    last_queue_tasks.clear()
+                else:
+                    last_queue_tasks[_get_playback_queue_name(tool_call)] = task
+        tasks.append(task)
+
+    # Results land in the order of the tool calls, regardless of when they finished.
+    results: list[list[AnyMessage]] = await asyncio.gather(*tasks)
+
+    return Command(
+        update={"messages": [message for messages in results for message in messages]}
+    )
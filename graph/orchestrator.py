@@ -1,22 +1,17 @@
-import base64
-import fnmatch
-import json
-import os
-import time
+import copy
 import uuid
-from hashlib import md5
-from pathlib import Path
+from functools import cache
 
-from dotenv import load_dotenv
 from langchain_core.messages import (
     ToolCall,
     InvalidToolCall,
     AIMessage,
+    AnyMessage,
+    HumanMessage,
     SystemMessage,
 )
-from langchain_core.messages.content import create_text_block
-from langchain_core.runnables import RunnableConfig
-from langchain_openai import ChatOpenAI
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable, RunnableConfig
 from langgraph.constants import END
 from langgraph.graph import StateGraph
 from langgraph.prebuilt import tools_condition
@@ -24,53 +19,99 @@ from langgraph.runtime import Runtime
 from langgraph.types import Command
 from pydantic import SecretStr
 
+from config.settings import get_settings
+from graph.attachments import ingest_attachment
+from graph.compaction import compact_history, format_messages, get_history_token_budget
 from graph.models import OrchestratorState, OrchestratorOutputState
-from graph.node.async_tool_node_wrapper import async_tool_node_wrapper
 from graph.node.output_shaper import output_shaper
-from graph.tools import get_tools, get_tool_list
-from prompt.orchestrator import ORCHESTRATOR_SYSTEM_PROMPT
-from store.references import get_reference_key
-
-load_dotenv()
-
-orchestrator_model = ChatOpenAI(
-    base_url=os.getenv("API_BASE_URL_MLX_LM"),
-    api_key=SecretStr("none"),
-    model=os.getenv("MODEL_ORCHESTRATOR"),
-    streaming=True,
-    temperature=0,
-    max_tokens=4096,
-)
+from graph.node.tool_scheduler import run_tool_call, tool_scheduler
+from graph.prompt import get_prompt_cache_usage, get_system_message
+from graph.speculation import astream_with_tool_dispatch
+from graph.tools import get_tools
+from graph.utils import parse_json_array_tool_calls, strip_thinking
+from prompt.compaction import HISTORY_SUMMARY_SYSTEM_PROMPT
+from store.blobs import arestore_messages
+from store.references import get_reference_keys
+from telemetry.metrics import timed_node
+
+
+@cache
+def get_orchestrator_model() -> BaseChatModel:
+    # Imported on first use: `langchain_openai` (with `openai`) is the slowest
+    # import of the graph and not needed to load it.
+    from client.coalescing import CoalescingChatOpenAI
+
+    return CoalescingChatOpenAI(
+        base_url=get_settings().api_base_url_mlx_lm,
+        api_key=SecretStr("none"),
+        model=get_settings().model_orchestrator,
+        streaming=True,
+        temperature=0,
+        max_tokens=4096,
+        # Report token usage (including cached prompt tokens) while streaming.
+        stream_usage=True,
+    )
+
+
+@cache
+def get_orchestrator_model_with_tools() -> Runnable:
+    """Bind the tools once, so the tool schemas sent with every request stay identical."""
+    return get_orchestrator_model().bind_tools(
+        tools=[*get_tools()]
+        # TODO: removed TODOs tooling.
+        # tools=[write_todos, *get_tools()]
+    )
+
+
+async def summarize_history(
+    previous_summary: str | None,
+    messages: list[AnyMessage],
+) -> str:
+    """Summarize compacted messages, extending the previous summary."""
+    prompt_lines: list[str] = []
+    if previous_summary is not None:
+        prompt_lines.append(f"<previous_summary>\n{previous_summary}\n</previous_summary>")
+    prompt_lines.append(f"<messages>\n{format_messages(messages)}\n</messages>")
+
+    response: AIMessage = await get_orchestrator_model().ainvoke(
+        input=[
+            SystemMessage(content=HISTORY_SUMMARY_SYSTEM_PROMPT),
+            HumanMessage(content="\n".join(prompt_lines)),
+        ]
+    )
+    return strip_thinking(response.text)
 
 
+@timed_node("model")
 async def call_orchestrator(
     state: OrchestratorState,
     runtime: Runtime,
     config: RunnableConfig,
 ) -> Command:
-    # Build system prompt and prepend to input messages.
-    tool_list = get_tool_list()
-    system_message = SystemMessage(
-        content_blocks=[
-            create_text_block(
-                text=ORCHESTRATOR_SYSTEM_PROMPT.format(tool_list=tool_list)
-            ),
-            # TODO: removed TODOs tooling system prompt.
-            # create_text_block(text=WRITE_TODOS_SYSTEM_PROMPT),
-        ]
-    )
-
     # Handle attached files.
-    attachment_dir = Path(os.getenv("ATTACHMENT_DIR"))
-    file_counter = 1
-    for message in state["messages"]:
+    # Attachments are normalized once per message: the rewritten messages are
+    # written back to the state, so later turns and checkpoints only carry the
+    # text reference instead of the base64 payload.
+    attachment_count = state.get("attachment_count", 0)
+    input_messages: list[AnyMessage] = []
+    normalized_messages: list[AnyMessage] = []
+    attachment_blocks: list[dict] = []
+    attachment_file_paths: list[str] = []
+    # Checkpoints read back keep large values as blob references.
+    for message in await arestore_messages(state["messages"]):
         # Iterate `message.content` (not `content_blocks`) so in-place mutations
         # actually reach the message that gets sent to the model. `content_blocks`
         # returns a normalized copy when the raw content uses alternate shapes
         # (e.g. LangSmith UI images with `source_type`/`data`).
         if not isinstance(message.content, list):
+            input_messages.append(message)
             continue
-        for content_block in message.content:
+        # Mutate a copy so the state only changes through the returned update.
+        normalized_message = message.model_copy(
+            update={"content": copy.deepcopy(message.content)}
+        )
+        is_normalized = False
+        for content_block in normalized_message.content:
             if not isinstance(content_block, dict):
                 continue
             # Normalize attachment-like content blocks (files and base64 images)
@@ -90,58 +131,72 @@ async def call_orchestrator(
             else:
                 continue
 
-            mime_type = content_block.get("mime_type")
+            # Decode, hash and store the attachment off the event loop.
+            ingestion = await ingest_attachment(base64_data)
+            attachment_blocks.append(content_block)
+            attachment_file_paths.append(ingestion.file_path)
+            is_normalized = True
 
-            # Allow re-use of attached files.
-            attachment_hash = md5(base64_data.encode("ascii")).hexdigest()
-            file_path = attachment_dir.joinpath(
-                f"{int(time.time())}-{attachment_hash}"
-            )
+        if is_normalized:
+            normalized_messages.append(normalized_message)
+            input_messages.append(normalized_message)
+        else:
+            input_messages.append(message)
 
-            # Create directory or search for already attached file.
-            reuse_attached_file = False
-            if not os.path.exists(attachment_dir):
-                os.makedirs(attachment_dir)
-            else:
-                for file_name in os.listdir(attachment_dir):
-                    if fnmatch.fnmatch(file_name, f"*{attachment_hash}"):
-                        file_path = attachment_dir.joinpath(file_name)
-                        print("Using already attached file:", file_name)
-                        reuse_attached_file = True
-
-            if not reuse_attached_file:
-                with open(file_path, "wb") as f:
-                    f.write(base64.b64decode(base64_data.encode("ascii")))
-
-            attachment_ref = await get_reference_key(
-                runtime.store,
-                config["configurable"]["context"]["user_id"],
-                str(file_path),
-            )
-
-            # Transform attachment content block to text content block.
-            lines = [
-                f"Attached file #{file_counter}:",
-                f"  File path reference: {attachment_ref}",
-                f"  MIME type: {mime_type}",
-            ]
-            # Unset attachment-specific properties before reshaping.
-            for key in ("base64", "data", "source_type", "mime_type", "metadata"):
-                if key in content_block:
-                    del content_block[key]
-            content_block["type"] = "text"
-            content_block["text"] = "\n".join(lines)
-
-            file_counter += 1
-
-    messages = [system_message, *state["messages"]]
-    tools = get_tools()
-    orchestrator_model_with_tools = orchestrator_model.bind_tools(
-        tools=[*tools]
-        # TODO: removed TODOs tooling.
-        # tools=[write_todos, *tools]
+    # Resolve the references of all attachments in one go.
+    attachment_refs = await get_reference_keys(
+        runtime.store,
+        config["configurable"]["context"]["user_id"],
+        attachment_file_paths,
     )
-    response: AIMessage = await orchestrator_model_with_tools.ainvoke(input=messages)
+    for content_block, attachment_ref in zip(attachment_blocks, attachment_refs):
+        # Transform attachment content block to text content block.
+        attachment_count += 1
+        lines = [
+            f"Attached file #{attachment_count}:",
+            f"  File path reference: {attachment_ref}",
+            f"  MIME type: {content_block.get('mime_type')}",
+        ]
+        # Unset attachment-specific properties before reshaping.
+        for key in ("base64", "data", "source_type", "mime_type", "metadata"):
+            if key in content_block:
+                del content_block[key]
+        content_block["type"] = "text"
+        content_block["text"] = "\n".join(lines)
+
+    # Collapse older turns into a summary to stay within the token budget.
+    history_summary = state.get("history_summary")
+    input_messages, history_summary = await compact_history(
+        messages=input_messages,
+        history_summary=history_summary,
+        token_budget=get_history_token_budget(),
+        summarize=summarize_history,
+    )
+
+    # Prepend the stable system prompt to the input messages.
+    messages = [get_system_message(), *input_messages]
+    streamed_tool_calls: list[ToolCall] | None = None
+    if get_settings().orchestrator_speculative_tool_dispatch:
+        # Start tool calls while the rest of the response is still generated.
+        response, streamed_tool_calls = await astream_with_tool_dispatch(
+            model=get_orchestrator_model_with_tools(),
+            messages=messages,
+            config=config,
+            run_tool_call=run_tool_call,
+            parse_json_array="xlam-2" in (get_settings().model_orchestrator or "").lower(),
+        )
+    else:
+        response: AIMessage = await get_orchestrator_model_with_tools().ainvoke(
+            input=messages
+        )
+
+    prompt_cache_usage = get_prompt_cache_usage(response)
+    if prompt_cache_usage is not None:
+        print(
+            "Prompt cache:",
+            f"{prompt_cache_usage.cached_tokens}/{prompt_cache_usage.input_tokens} input tokens cached",
+            f"({prompt_cache_usage.hit_rate:.1%})",
+        )
 
     # Special handling for `xLAM 2`.
     # Try to decode the response as JSON array of tool calls.
@@ -150,21 +205,11 @@ async def call_orchestrator(
         and "xlam-2" in response.response_metadata["model_name"].lower()
     ):
         tool_calls: list[ToolCall] = []
-        try:
-            obj = json.loads(response.text)
-            if isinstance(obj, list):
-                for item in obj:
-                    if "name" in item and "arguments" in item:
-                        tool_calls.append(
-                            ToolCall(
-                                name=item["name"],
-                                args=item["arguments"],
-                                id=str(uuid.uuid4()),
-                            )
-                        )
-        except json.decoder.JSONDecodeError:
-            # `xLAM` can also print non-JSON values; continue.
-            pass
+        if streamed_tool_calls is not None:
+            # Already parsed (and possibly started) while streaming.
+            tool_calls = streamed_tool_calls
+        else:
+            tool_calls = parse_json_array_tool_calls(response.text)
 
         # Add or overwrite on the original response.
         if response.tool_calls:
@@ -188,7 +233,14 @@ async def call_orchestrator(
 
     response.pretty_print()
 
-    return Command(update={"messages": [response]})
+    update = {"messages": [*normalized_messages, response]}
+    if normalized_messages:
+        # Messages with an existing ID replace the original ones in the state.
+        update["attachment_count"] = attachment_count
+    if history_summary != state.get("history_summary"):
+        update["history_summary"] = history_summary
+
+    return Command(update=update)
 
 
 orchestrator_graph = StateGraph(
@@ -197,7 +249,7 @@ orchestrator_graph = StateGraph(
 )
 
 orchestrator_graph.add_node("model", call_orchestrator)
-orchestrator_graph.add_node("tools", async_tool_node_wrapper)
+orchestrator_graph.add_node("tools", tool_scheduler)
 orchestrator_graph.add_node("output", output_shaper)
 orchestrator_graph.add_conditional_edges(
     "model", tools_condition, {"tools": "tools", END: "output"}
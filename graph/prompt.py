@@ -0,0 +1,48 @@
+from functools import cache
+
+from langchain_core.messages import AIMessage, SystemMessage
+from langchain_core.messages.content import create_text_block
+from pydantic import BaseModel
+
+from graph.tools import get_tool_list
+from prompt.orchestrator import ORCHESTRATOR_SYSTEM_PROMPT
+
+
+class PromptCacheUsage(BaseModel):
+    input_tokens: int
+    cached_tokens: int
+
+    @property
+    def hit_rate(self) -> float:
+        return self.cached_tokens / self.input_tokens if self.input_tokens > 0 else 0.0
+
+
+@cache
+def get_system_message() -> SystemMessage:
+    """Build the orchestrator system prompt once.
+
+    The system prompt and the tool schemas are the shared prefix of every
+    request, so they have to stay byte-identical across turns and threads for
+    the mlx-lm server to reuse its prompt cache instead of prefilling them again.
+    """
+    return SystemMessage(
+        content_blocks=[
+            create_text_block(
+                text=ORCHESTRATOR_SYSTEM_PROMPT.format(tool_list=get_tool_list())
+            ),
+            # TODO: removed TODOs tooling system prompt.
+            # create_text_block(text=WRITE_TODOS_SYSTEM_PROMPT),
+        ]
+    )
+
+
+def get_prompt_cache_usage(response: AIMessage) -> PromptCacheUsage | None:
+    """Return how many input tokens of the response were served from the prompt cache."""
+    if response.usage_metadata is None:
+        return None
+
+    input_token_details = response.usage_metadata.get("input_token_details") or {}
+    return PromptCacheUsage(
+        input_tokens=response.usage_metadata["input_tokens"],
+        cached_tokens=input_token_details.get("cache_read") or 0,
+    )
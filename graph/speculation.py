@@ -0,0 +1,295 @@
+import asyncio
+import json
+import time
+import uuid
+from collections.abc import Callable, Coroutine
+from typing import Any
+
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    AnyMessage,
+    ToolCall,
+    message_chunk_to_message,
+)
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from graph.utils import parse_json_array_tool_calls
+
+# Tools that are safe to start before the model response is complete.
+# Their results only depend on the arguments, so running them early never
+# changes the outcome compared to running them in the `tools` node (unless
+# they are asked to start playback, see `is_speculative_tool_call()`).
+SPECULATIVE_TOOLS = {
+    "convert_text_to_speech",
+    "get_mime_type",
+    "read_file",
+    "transcribe_audio",
+    "translate_text",
+}
+# Started tool calls not taken over by the `tools` node within this time are
+# cancelled (e.g. if the run was interrupted or failed before it, and the thread
+# doesn't continue).
+SPECULATIVE_TASK_TTL_SECONDS = 15 * 60
+
+
+def is_speculative_tool_call(tool_call: ToolCall) -> bool:
+    # Playback has to wait for the `tools` node to keep the order of the queue.
+    return tool_call["name"] in SPECULATIVE_TOOLS and not tool_call["args"].get(
+        "playback_queue_name"
+    )
+
+
+ToolCallRunner = Callable[
+    [ToolCall, RunnableConfig], Coroutine[Any, Any, list[AnyMessage]]
+]
+
+
+class SpeculativeToolDispatcher:
+    """Keeps track of tool calls started while the orchestrator is still streaming.
+
+    Tasks are keyed by thread and tool call ID: coalesced model requests of
+    different threads share their response, including the tool call IDs.
+    Tasks the `tools` node never takes over are cancelled at the next model
+    turn of the thread (see `cancel_thread()`), or after
+    `SPECULATIVE_TASK_TTL_SECONDS` if the thread doesn't continue.
+    """
+
+    def __init__(self):
+        self._tasks: dict[tuple[str, str], asyncio.Task[list[AnyMessage]]] = {}
+        self._dispatched_at: dict[tuple[str, str], float] = {}
+
+    @staticmethod
+    def _key(config: RunnableConfig, tool_call_id: str) -> tuple[str, str]:
+        return config["configurable"]["thread_id"], tool_call_id
+
+    def dispatch(
+        self,
+        config: RunnableConfig,
+        tool_call_id: str,
+        coroutine: Coroutine[Any, Any, list[AnyMessage]],
+    ):
+        """Start the tool call of the thread in the background."""
+        self._cancel_expired()
+        key = self._key(config, tool_call_id)
+        self._tasks[key] = asyncio.create_task(coroutine)
+        self._dispatched_at[key] = time.monotonic()
+
+    def pop(
+        self, config: RunnableConfig, tool_call_id: str
+    ) -> asyncio.Task[list[AnyMessage]] | None:
+        """Take over the task of an already started tool call of the thread."""
+        key = self._key(config, tool_call_id)
+        self._dispatched_at.pop(key, None)
+        return self._tasks.pop(key, None)
+
+    def _cancel_keys(self, keys: list[tuple[str, str]]):
+        for key in keys:
+            self._dispatched_at.pop(key, None)
+            task = self._tasks.pop(key, None)
+            if task is not None:
+                task.cancel()
+
+    def cancel(self, config: RunnableConfig, tool_call_ids: list[str]):
+        """Cancel started tool calls of the thread that will never be consumed."""
+        self._cancel_keys(
+            [self._key(config, tool_call_id) for tool_call_id in tool_call_ids]
+        )
+
+    def cancel_thread(self, config: RunnableConfig):
+        """Cancel all started tool calls of the thread, left over from an earlier turn."""
+        thread_id = config["configurable"]["thread_id"]
+        leftover_keys = [key for key in self._tasks if key[0] == thread_id]
+        if leftover_keys:
+            print(f"Cancelling {len(leftover_keys)} leftover speculative tool call(s).")
+        self._cancel_keys(leftover_keys)
+
+    def _cancel_expired(self):
+        expired_before = time.monotonic() - SPECULATIVE_TASK_TTL_SECONDS
+        self._cancel_keys(
+            [
+                key
+                for key, dispatched_at in self._dispatched_at.items()
+                if dispatched_at < expired_before
+            ]
+        )
+
+
+speculative_dispatcher = SpeculativeToolDispatcher()
+
+
+class JSONArrayItemParser:
+    """Incrementally extract the objects of a streamed JSON array.
+
+    Used for `xLAM 2`, which prints its tool calls as a JSON array of
+    `{"name": ..., "arguments": ...}` objects instead of native tool calls.
+    Like `parse_json_array_tool_calls()`, only text that starts with the
+    array is parsed, and nothing after the array is closed.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._depth = 0
+        self._done = False
+        self._in_string = False
+        self._escape = False
+        self._item_start: int | None = None
+
+    def feed(self, text: str) -> list[dict]:
+        """Add streamed text and return the objects completed by it."""
+        self._buffer += text
+        items: list[dict] = []
+
+        while not self._done and self._position < len(self._buffer):
+            char = self._buffer[self._position]
+            if self._depth == 0:
+                if char == "[":
+                    self._depth = 1
+                elif not char.isspace():
+                    # Not a JSON array as a whole (e.g. text or `<think>` first).
+                    self._done = True
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "[{":
+                if self._depth == 1 and char == "{":
+                    self._item_start = self._position
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    # Anything after the array is ignored.
+                    self._done = True
+                if self._depth == 1 and char == "}" and self._item_start is not None:
+                    try:
+                        item = json.loads(
+                            self._buffer[self._item_start : self._position + 1]
+                        )
+                        if isinstance(item, dict):
+                            items.append(item)
+                    except json.decoder.JSONDecodeError:
+                        pass
+                    self._item_start = None
+            self._position += 1
+
+        return items
+
+
+async def astream_with_tool_dispatch(
+    model: Runnable[LanguageModelInput, AIMessageChunk],
+    messages: list[AnyMessage],
+    config: RunnableConfig,
+    run_tool_call: ToolCallRunner,
+    parse_json_array: bool = False,
+) -> tuple[AIMessage, list[ToolCall] | None]:
+    """Stream the model response and start each tool call as soon as its arguments are complete.
+
+    Returns the complete response and, if `parse_json_array` is set, the tool
+    calls parsed from the response text if it is a JSON array (see
+    `parse_json_array_tool_calls()`).
+    """
+    response_chunk: AIMessageChunk | None = None
+    completed_tool_calls: dict[int, ToolCall] = {}
+    json_array_parser = JSONArrayItemParser() if parse_json_array else None
+    json_array_tool_calls: list[ToolCall] = []
+    dispatched_ids: list[str] = []
+    # Tool calls started by an earlier turn that never reached the `tools` node.
+    speculative_dispatcher.cancel_thread(config)
+
+    def _dispatch(tool_call: ToolCall):
+        if is_speculative_tool_call(tool_call):
+            print("Speculatively starting tool call:", tool_call["name"])
+            speculative_dispatcher.dispatch(
+                config, tool_call["id"], run_tool_call(tool_call, config)
+            )
+            dispatched_ids.append(tool_call["id"])
+
+    try:
+        async for chunk in model.astream(input=messages):
+            response_chunk = chunk if response_chunk is None else response_chunk + chunk
+
+            if json_array_parser is not None and chunk.text:
+                for item in json_array_parser.feed(chunk.text):
+                    if "name" in item and "arguments" in item:
+                        tool_call = ToolCall(
+                            name=item["name"],
+                            args=item["arguments"],
+                            id=str(uuid.uuid4()),
+                        )
+                        json_array_tool_calls.append(tool_call)
+                        _dispatch(tool_call)
+
+            # Native tool calls are complete once their arguments are valid JSON.
+            for tool_call_chunk in response_chunk.tool_call_chunks:
+                index = tool_call_chunk.get("index")
+                if (
+                    index is None
+                    or index in completed_tool_calls
+                    or not tool_call_chunk.get("name")
+                ):
+                    continue
+                try:
+                    args = json.loads(tool_call_chunk.get("args") or "")
+                except json.decoder.JSONDecodeError:
+                    continue
+                if not isinstance(args, dict):
+                    continue
+                tool_call = ToolCall(
+                    name=tool_call_chunk["name"],
+                    args=args,
+                    id=tool_call_chunk.get("id") or str(uuid.uuid4()),
+                )
+                completed_tool_calls[index] = tool_call
+                _dispatch(tool_call)
+    except BaseException:
+        speculative_dispatcher.cancel(config, dispatched_ids)
+        raise
+
+    if response_chunk is None:
+        response_chunk = AIMessageChunk(content="")
+    response = message_chunk_to_message(response_chunk)
+
+    # Give the final tool calls the IDs of the already started ones.
+    unmatched_tool_calls = list(completed_tool_calls.values())
+    for tool_call in response.tool_calls:
+        for completed_tool_call in unmatched_tool_calls:
+            if (
+                completed_tool_call["name"] == tool_call["name"]
+                and completed_tool_call["args"] == tool_call["args"]
+            ):
+                tool_call["id"] = completed_tool_call["id"]
+                unmatched_tool_calls.remove(completed_tool_call)
+                break
+    speculative_dispatcher.cancel(
+        config, [tool_call["id"] for tool_call in unmatched_tool_calls]
+    )
+
+    if not parse_json_array:
+        return response, None
+
+    # Only keep the streamed calls that the complete text confirms, e.g. not if
+    # text follows the array, and give them the IDs of the already started ones.
+    final_json_array_tool_calls = parse_json_array_tool_calls(response.text)
+    unmatched_tool_calls = list(json_array_tool_calls)
+    for tool_call in final_json_array_tool_calls:
+        for streamed_tool_call in unmatched_tool_calls:
+            if (
+                streamed_tool_call["name"] == tool_call["name"]
+                and streamed_tool_call["args"] == tool_call["args"]
+            ):
+                tool_call["id"] = streamed_tool_call["id"]
+                unmatched_tool_calls.remove(streamed_tool_call)
+                break
+    speculative_dispatcher.cancel(
+        config, [tool_call["id"] for tool_call in unmatched_tool_calls]
+    )
+
+    return response, final_json_array_tool_calls
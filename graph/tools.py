@@ -1,38 +1,42 @@
+import importlib
+from functools import cache
+
 from langchain_core.tools import BaseTool
 
-from tool.audio_playback import (
-    get_audio_queue_status,
-    list_audio_queues,
-    play_audio_queue,
-    set_audio_volume,
-    skip_audio_track,
-    stop_all_audio_queues,
-    stop_audio_queue,
-)
-from tool.general import sleep, read_file, get_mime_type
-from tool.language import translate_text
-from tool.stt import call_transcribe_audio
-from tool.tts import convert_text_to_speech
-
-
-def get_tools() -> list[BaseTool]:
-    return [
-        convert_text_to_speech,
-        call_transcribe_audio,
-        get_audio_queue_status,
-        get_mime_type,
-        list_audio_queues,
-        play_audio_queue,
-        read_file,
-        set_audio_volume,
-        skip_audio_track,
-        sleep,
-        stop_all_audio_queues,
-        stop_audio_queue,
-        translate_text,
-    ]
+# Module and attribute of each tool, by tool name.
+# Tool modules import their clients and heavier dependencies (`openai`,
+# `langchain_openai`, `magic`, `httpx`), so they are only imported once the
+# tools are first needed instead of when the graph is imported.
+TOOL_REGISTRY: dict[str, tuple[str, str]] = {
+    "convert_text_to_speech": ("tool.tts", "convert_text_to_speech"),
+    "transcribe_audio": ("tool.stt", "call_transcribe_audio"),
+    "get_audio_queue_status": ("tool.audio_playback", "get_audio_queue_status"),
+    "get_mime_type": ("tool.general", "get_mime_type"),
+    "list_audio_queues": ("tool.audio_playback", "list_audio_queues"),
+    "play_audio_queue": ("tool.audio_playback", "play_audio_queue"),
+    "read_file": ("tool.general", "read_file"),
+    "set_audio_volume": ("tool.audio_playback", "set_audio_volume"),
+    "skip_audio_track": ("tool.audio_playback", "skip_audio_track"),
+    "sleep": ("tool.general", "sleep"),
+    "stop_all_audio_queues": ("tool.audio_playback", "stop_all_audio_queues"),
+    "stop_audio_queue": ("tool.audio_playback", "stop_audio_queue"),
+    "translate_text": ("tool.language", "translate_text"),
+}
+
+
+@cache
+def get_tool(name: str) -> BaseTool:
+    """Import the module of the tool (on first use) and return the tool."""
+    module_name, attribute = TOOL_REGISTRY[name]
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+@cache
+def get_tools() -> tuple[BaseTool, ...]:
+    return tuple(get_tool(name) for name in TOOL_REGISTRY)
 
 
+@cache
 def get_tool_list() -> str:
     tools = get_tools()
     return "\n".join(
@@ -1,4 +1,8 @@
+import json
 import re
+import uuid
+
+from langchain_core.messages import ToolCall
 
 
 def strip_thinking(content: str) -> str:
@@ -6,3 +10,28 @@ def strip_thinking(content: str) -> str:
     regex = re.compile(r"<think>.*?</think>", re.DOTALL)
     non_thinking_content = re.sub(regex, "", content).strip()
     return non_thinking_content
+
+
+def parse_json_array_tool_calls(text: str) -> list[ToolCall]:
+    """Parse tool calls from a response text that is a JSON array of `{"name": ..., "arguments": ...}` objects.
+
+    Used for `xLAM 2`, which prints its tool calls instead of native tool calls.
+    Any other text (including a JSON array within other text) has no tool calls.
+    """
+    tool_calls: list[ToolCall] = []
+    try:
+        obj = json.loads(text)
+    except json.decoder.JSONDecodeError:
+        # `xLAM` can also print non-JSON values; continue.
+        return tool_calls
+    if isinstance(obj, list):
+        for item in obj:
+            if isinstance(item, dict) and "name" in item and "arguments" in item:
+                tool_calls.append(
+                    ToolCall(
+                        name=item["name"],
+                        args=item["arguments"],
+                        id=str(uuid.uuid4()),
+                    )
+                )
+    return tool_calls
@@ -1,38 +1,29 @@
 import asyncio
 import base64
-import os
 import time
 import uuid
 
 import magic
-from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage
 from langchain_core.messages.content import (
     create_text_block,
     create_image_block,
 )
 from langchain_core.runnables import RunnableConfig
-from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
-from langgraph.store.postgres import AsyncPostgresStore
 from langgraph.types import Command
 
+from client.http import aclose_http_clients
+from config.settings import get_settings
 from graph.orchestrator import orchestrator_graph
-
-load_dotenv()
+from store.postgres import get_pool_stats, open_postgres
 
 GRAPH = orchestrator_graph
-DB_URI = os.environ.get("POSTGRES_DB_URI")
+DB_URI = get_settings().postgres_db_uri
 
 
 async def main():
     start_time = time.time()
-    async with (
-        AsyncPostgresStore.from_conn_string(DB_URI) as store,
-        AsyncPostgresSaver.from_conn_string(DB_URI) as checkpointer,
-    ):
-        await store.setup()
-        await checkpointer.setup()
-
+    async with open_postgres(DB_URI) as (store, checkpointer, pool):
         graph_compiled = GRAPH.compile(
             checkpointer=checkpointer,
             store=store,
@@ -48,11 +39,6 @@ async def main():
             },
         }
 
-        # Write graph diagram to file.
-        image_bytes = graph_compiled.get_graph().draw_mermaid_png()
-        with open("graph.png", "wb") as f:
-            f.write(image_bytes)
-
         # Create file attachment.
         # file_path = "/Users/dbu/workspace/locallm/test_files/ch-8s.wav"
         # file_path = "/Users/dbu/workspace/locallm/test_files/lean-on-me.mp3"
@@ -114,6 +100,16 @@ async def main():
         end_time = time.time()
         print(f"\n>>> Worked for {end_time - start_time} seconds.")
 
+        pool_stats = get_pool_stats(pool)
+        print(
+            ">>> Postgres pool:",
+            f"{pool_stats.pool_size} connection(s),",
+            f"{pool_stats.pool_available} available,",
+            f"{pool_stats.average_wait_ms:.1f}ms average wait",
+        )
+
+    await aclose_http_clients()
+
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -8,6 +8,8 @@ from pathlib import Path
 
 import vlc
 
+from audio_stream import AudioStream
+
 logger = logging.getLogger(__name__)
 
 
@@ -25,6 +27,8 @@ class AudioQueue:
         self._on_empty = on_empty
         self._files: deque[str] = deque()
         self._current_file: str | None = None
+        # Streams in the queue by the path of their pipe.
+        self._streams: dict[str, AudioStream] = {}
         self._is_playing = False
         self._stop_requested = False
 
@@ -111,6 +115,12 @@ class AudioQueue:
             else:
                 logger.warning(f"[{self.name}] File not found: {file_path}")
 
+    def append_stream(self, stream: AudioStream):
+        """Append a stream to the queue, played while it is still being received."""
+        self._streams[stream.path] = stream
+        self._files.append(stream.path)
+        logger.info(f"[{self.name}] Added stream to queue: {stream.path}")
+
     def skip(self):
         """Skip the current track."""
         if self._is_playing:
@@ -122,6 +132,9 @@ class AudioQueue:
         """Stop the queue and clear all files."""
         self._stop_requested = True
         self._files.clear()
+        for stream in self._streams.values():
+            stream.cancel()
+        self._streams.clear()
         self._player.stop()
         self._is_playing = False
         self._current_file = None
@@ -165,8 +178,15 @@ class AudioQueue:
 
         self._is_playing = False
 
+        stream = self._streams.pop(file_path, None)
+        if stream:
+            stream.cancel()
+
     def cleanup(self):
-        """Release VLC resources."""
+        """Release VLC resources and cancel the streams that were never played."""
+        for stream in self._streams.values():
+            stream.cancel()
+        self._streams.clear()
         self._player.stop()
         self._player.release()
         self._vlc_instance.release()
@@ -177,6 +197,8 @@ class AudioQueue:
         if self._current_file:
             # Include current file at the start (it will be replayed)
             files.insert(0, self._current_file)
+        # Streams can't be replayed after a restart.
+        files = [file_path for file_path in files if file_path not in self._streams]
         return {
             "name": self.name,
             "volume": self._volume,
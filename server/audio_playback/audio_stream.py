@@ -0,0 +1,75 @@
+"""Audio streamed into a queue while it is still being received."""
+
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Interval to check for a reader of the pipe (bounds the added start latency).
+READER_POLL_INTERVAL = 0.01
+
+
+class AudioStream:
+    """Audio bytes played through a named pipe (FIFO) as they arrive.
+
+    VLC plays the pipe like a file, so a stream takes a regular place in its
+    queue. Received chunks are buffered and written to the pipe by a thread,
+    which waits until VLC opens the pipe, so receiving never waits for
+    playback (e.g. while earlier files of the queue are still playing).
+    """
+
+    def __init__(self):
+        self._dir = tempfile.mkdtemp(prefix="audio-stream-")
+        self.path = str(Path(self._dir).joinpath("stream"))
+        os.mkfifo(self.path)
+        self._chunks: queue.Queue[bytes | None] = queue.Queue()
+        self._cancelled = threading.Event()
+        self._writer = threading.Thread(target=self._write, daemon=True)
+        self._writer.start()
+
+    def _write(self):
+        """Write the buffered chunks to the pipe (runs in the writer thread)."""
+        try:
+            fd = self._open_for_writing()
+            if fd is None:
+                return
+            with os.fdopen(fd, "wb") as fifo:
+                while (chunk := self._chunks.get()) is not None:
+                    fifo.write(chunk)
+                    fifo.flush()
+        except BrokenPipeError:
+            logger.info(f"Stream closed by the reader: {self.path}")
+        finally:
+            shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _open_for_writing(self) -> int | None:
+        """Open the pipe once it is opened for reading, or return None if cancelled before."""
+        while not self._cancelled.is_set():
+            try:
+                fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError:
+                # No reader yet (ENXIO).
+                time.sleep(READER_POLL_INTERVAL)
+                continue
+            os.set_blocking(fd, True)
+            return fd
+        return None
+
+    def feed(self, chunk: bytes):
+        """Buffer a received chunk for playback."""
+        self._chunks.put(chunk)
+
+    def close(self):
+        """Mark the end of the stream once all chunks are fed."""
+        self._chunks.put(None)
+
+    def cancel(self):
+        """Stop the writer, e.g. when the stream is skipped or never played."""
+        self._cancelled.set()
+        self.close()
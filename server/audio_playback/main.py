@@ -6,8 +6,11 @@ from contextlib import asynccontextmanager
 from urllib.parse import urlparse
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from starlette.requests import ClientDisconnect
 
+from audio_stream import AudioStream
+from metrics import setup_metrics
 from models import QueueCreate, QueueInfo, QueueStatus, VolumeUpdate
 from queue_manager import QueueManager
 from state import StatePersistence
@@ -52,6 +55,7 @@ app = FastAPI(
     version="1.0.0",
     lifespan=lifespan,
 )
+setup_metrics(app, queue_manager)
 
 
 @app.get("/queues", response_model=list[QueueInfo], operation_id="list_audio_queues")
@@ -104,6 +108,52 @@ async def play_audio(name: str, request: QueueCreate):
     )
 
 
+@app.post(
+    "/queues/{name}/stream", response_model=QueueStatus, operation_id="stream_audio"
+)
+async def stream_audio(
+    name: str,
+    request: Request,
+    volume: float | None = Query(default=None, ge=0.0, le=1.0),
+):
+    """Play audio streamed in the request body on a named playback queue.
+
+    The audio (e.g. WAV) is added to the queue like a file, but starts playing
+    as soon as its first bytes arrive instead of once the upload is complete.
+    Responds once the whole stream is received.
+
+    Args:
+        name: Unique identifier for the audio queue (e.g., 'music', 'tts', 'alerts')
+        volume: Optional playback volume level from 0.0 (muted) to 1.0 (full volume)
+    """
+    stream = AudioStream()
+    queue = await queue_manager.append_stream_to_queue(
+        name=name,
+        stream=stream,
+        volume=volume,
+    )
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                stream.feed(chunk)
+    except ClientDisconnect:
+        logger.warning(f"[{name}] Stream interrupted by the client")
+        raise
+    finally:
+        # Play whatever was received.
+        stream.close()
+
+    return QueueStatus(
+        name=queue.name,
+        volume=queue.volume,
+        current_file=queue.current_file,
+        current_position=queue.get_position(),
+        current_duration=queue.get_duration(),
+        remaining_files=queue.remaining_files,
+        is_playing=queue.is_playing,
+    )
+
+
 @app.get("/queues/{name}", response_model=QueueStatus, operation_id="get_queue_status")
 async def get_audio_queue_status(name: str):
     """Get the current status of an audio playback queue.
@@ -0,0 +1,76 @@
+"""Prometheus metrics of the audio playback service."""
+
+import time
+
+from fastapi import FastAPI, Request, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+from queue_manager import QueueManager
+
+REQUEST_DURATION = Histogram(
+    "audio_playback_request_duration_seconds",
+    "Duration of HTTP requests.",
+    ["method", "route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+REQUEST_ERRORS = Counter(
+    "audio_playback_request_errors_total",
+    "HTTP requests answered with an error status or failing with an exception.",
+    ["method", "route", "status"],
+)
+ACTIVE_QUEUES = Gauge(
+    "audio_playback_active_queues",
+    "Number of active audio queues.",
+)
+PLAYING_QUEUES = Gauge(
+    "audio_playback_playing_queues",
+    "Number of audio queues currently playing.",
+)
+
+
+def setup_metrics(app: FastAPI, queue_manager: QueueManager):
+    """Record the duration and errors of all requests and serve the metrics on `/metrics`."""
+
+    @app.middleware("http")
+    async def record_request_metrics(request: Request, call_next):
+        start_time = time.perf_counter()
+        try:
+            response = await call_next(request)
+        except Exception:
+            route = _route_path(request)
+            REQUEST_ERRORS.labels(request.method, route, "500").inc()
+            REQUEST_DURATION.labels(request.method, route).observe(
+                time.perf_counter() - start_time
+            )
+            raise
+
+        route = _route_path(request)
+        if route != "/metrics":
+            REQUEST_DURATION.labels(request.method, route).observe(
+                time.perf_counter() - start_time
+            )
+            if response.status_code >= 400:
+                REQUEST_ERRORS.labels(
+                    request.method, route, str(response.status_code)
+                ).inc()
+        return response
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Serve the metrics in the Prometheus text format."""
+        queues = [queue_manager.get_queue(name) for name in queue_manager.queue_names]
+        ACTIVE_QUEUES.set(len(queues))
+        PLAYING_QUEUES.set(sum(1 for queue in queues if queue and queue.is_playing))
+        return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def _route_path(request: Request) -> str:
+    """Return the route template (e.g. `/queues/{name}`), so queue names don't become labels."""
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
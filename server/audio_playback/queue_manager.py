@@ -4,6 +4,7 @@ import asyncio
 import logging
 
 from audio_queue import AudioQueue
+from audio_stream import AudioStream
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +26,43 @@ class QueueManager:
         """Get a queue by name."""
         return self._queues.get(name)
 
+    def _get_running_queue(self, name: str) -> AudioQueue | None:
+        """Get a queue whose run loop is still running (call under the lock).
+
+        A queue whose run loop already exited (e.g. emptied, with its removal
+        still pending) would never play anything appended to it, so it is
+        removed here and treated as missing.
+        """
+        queue = self._queues.get(name)
+        if queue is None:
+            return None
+        task = self._tasks.get(name)
+        if task is not None and not task.done():
+            return queue
+
+        self._queues.pop(name)
+        self._tasks.pop(name, None)
+        queue.cleanup()
+        logger.info(f"Removed stopped queue: {name}")
+        return None
+
+    def _start_queue(self, name: str, volume: float) -> AudioQueue:
+        """Create a queue and start its run loop (call under the lock)."""
+        # Create new queue with auto-cleanup callback
+        queue = AudioQueue(
+            name=name,
+            volume=volume,
+            on_empty=self._on_queue_empty,
+        )
+        self._queues[name] = queue
+
+        # Start the queue's run loop
+        task = asyncio.create_task(queue.run())
+        self._tasks[name] = task
+
+        logger.info(f"Created queue: {name}")
+        return queue
+
     async def create_queue(
         self,
         name: str,
@@ -33,39 +71,21 @@ class QueueManager:
     ) -> AudioQueue:
         """Create a new queue or get existing one."""
         async with self._lock:
-            if name in self._queues:
-                queue = self._queues[name]
-                if files:
-                    queue.append(files)
-                return queue
-
-            # Create new queue with auto-cleanup callback
-            queue = AudioQueue(
-                name=name,
-                volume=volume,
-                on_empty=self._on_queue_empty,
-            )
+            queue = self._get_running_queue(name) or self._start_queue(name, volume)
             if files:
                 queue.append(files)
-
-            self._queues[name] = queue
-
-            # Start the queue's run loop
-            task = asyncio.create_task(queue.run())
-            self._tasks[name] = task
-
-            logger.info(f"Created queue: {name}")
             return queue
 
     def _on_queue_empty(self, queue: AudioQueue):
         """Callback when a queue becomes empty."""
-        asyncio.create_task(self._cleanup_queue(queue.name))
+        asyncio.create_task(self._cleanup_queue(queue))
 
-    async def _cleanup_queue(self, name: str):
-        """Remove an empty queue."""
+    async def _cleanup_queue(self, queue: AudioQueue):
+        """Remove an empty queue (unless it was already replaced by a new one)."""
         async with self._lock:
-            if name in self._queues:
-                queue = self._queues.pop(name)
+            name = queue.name
+            if self._queues.get(name) is queue:
+                self._queues.pop(name)
                 queue.cleanup()
 
                 if name in self._tasks:
@@ -87,8 +107,7 @@ class QueueManager:
     ) -> AudioQueue:
         """Append files to an existing queue or create new one."""
         async with self._lock:
-            if name in self._queues:
-                queue = self._queues[name]
+            if queue := self._get_running_queue(name):
                 queue.append(files)
                 if volume is not None:
                     queue.volume = volume
@@ -97,6 +116,25 @@ class QueueManager:
         # Queue doesn't exist, create it
         return await self.create_queue(name, files, volume or 1.0)
 
+    async def append_stream_to_queue(
+        self,
+        name: str,
+        stream: AudioStream,
+        volume: float | None = None,
+    ) -> AudioQueue:
+        """Append a stream to an existing queue or create new one."""
+        async with self._lock:
+            if queue := self._get_running_queue(name):
+                queue.append_stream(stream)
+                if volume is not None:
+                    queue.volume = volume
+                return queue
+
+            # Queue doesn't exist, create it (its run loop starts once this yields)
+            queue = self._start_queue(name, volume or 1.0)
+            queue.append_stream(stream)
+            return queue
+
     async def remove_queue(self, name: str) -> bool:
         """Stop and remove a queue."""
         async with self._lock:
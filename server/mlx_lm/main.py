@@ -14,4 +14,10 @@ if __name__ == "__main__":
         parsed = urlparse(base_url)
         sys.argv.extend(["--port", str(parsed.port)])
 
+    # Keep the KV caches of several prompts, so the shared system prompt and tool
+    # schema prefix of concurrent threads is not evicted by each other.
+    prompt_cache_size = os.getenv("MLX_LM_PROMPT_CACHE_SIZE")
+    if prompt_cache_size is not None:
+        sys.argv.extend(["--prompt-cache-size", prompt_cache_size])
+
     main()
@@ -0,0 +1,229 @@
+import asyncio
+import os
+import tempfile
+from functools import cache
+from hashlib import sha256
+from pathlib import Path
+from typing import Any
+
+from langchain_core.messages import AnyMessage
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from pydantic import BaseModel
+
+from config.settings import get_settings
+
+# Values replaced by a blob reference keep the type in the prefix, so they are
+# restored as the same type.
+BLOB_REFERENCE_PREFIX_STR = "blob:str:sha256:"
+BLOB_REFERENCE_PREFIX_BYTES = "blob:bytes:sha256:"
+# Strings and bytes of at least this size are moved to the blob store.
+DEFAULT_BLOB_MIN_SIZE = 64 * 1024
+# Message fields sent to the model, restored by `arestore_messages()`. Tool
+# artifacts (e.g. generated audio) stay blob references.
+MESSAGE_FIELDS_TO_RESTORE = ("content", "tool_calls", "invalid_tool_calls")
+
+
+class BlobStore:
+    """Content-addressed blob store on local disk."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    def _path(self, digest: str) -> Path:
+        # Shard by the first two hex characters to keep directories small.
+        return self.directory.joinpath(digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        """Store the data (once) and return its SHA-256 hex digest."""
+        digest = sha256(data).hexdigest()
+        path = self._path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file and rename, so readers never see partial blobs.
+            file_descriptor, temp_file_path = tempfile.mkstemp(dir=path.parent)
+            try:
+                with os.fdopen(file_descriptor, "wb") as f:
+                    f.write(data)
+                os.replace(temp_file_path, path)
+            except BaseException:
+                if os.path.exists(temp_file_path):
+                    os.remove(temp_file_path)
+                raise
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with open(self._path(digest), "rb") as f:
+            return f.read()
+
+
+@cache
+def get_blob_store() -> BlobStore:
+    """Return the blob store in `BLOB_DIR` (required to use it)."""
+    blob_dir = get_settings().blob_dir
+    if not blob_dir:
+        raise ValueError(
+            "BLOB_DIR is not set: it is required to store and restore checkpoint blobs."
+        )
+    return BlobStore(Path(blob_dir))
+
+
+def is_blob_reference(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(
+        (BLOB_REFERENCE_PREFIX_STR, BLOB_REFERENCE_PREFIX_BYTES)
+    )
+
+
+def contains_blob_reference(obj: Any) -> bool:
+    """Whether the object holds a blob reference, in containers and model fields like `BlobOffloadingSerializer._map()`."""
+    if isinstance(obj, str):
+        return is_blob_reference(obj)
+    if isinstance(obj, (list, tuple)):
+        return any(contains_blob_reference(item) for item in obj)
+    if isinstance(obj, dict):
+        return any(contains_blob_reference(value) for value in obj.values())
+    if isinstance(obj, BaseModel):
+        return any(
+            contains_blob_reference(getattr(obj, field_name, None))
+            for field_name in type(obj).model_fields
+        )
+    return False
+
+
+class BlobOffloadingSerializer(SerializerProtocol):
+    """Checkpoint serializer moving large strings and bytes into a blob store.
+
+    Base64 attachments and audio payloads (e.g. `TTSGenerationArtifact.base64_data`)
+    are replaced by their hash before serializing, so checkpoints only carry the
+    hash. Reading a checkpoint keeps the references; values are only loaded from
+    the blob store when they are used (see `restore()` and `arestore_messages()`),
+    so history never read again costs no disk reads.
+    """
+
+    def __init__(
+        self,
+        blob_store: BlobStore,
+        min_size: int = DEFAULT_BLOB_MIN_SIZE,
+        serde: SerializerProtocol | None = None,
+    ):
+        self.blob_store = blob_store
+        self.min_size = min_size
+        self.serde = serde or JsonPlusSerializer()
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        return self.serde.dumps_typed(self._offload(obj))
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        return self.serde.loads_typed(data)
+
+    def offload(self, obj: Any) -> Any:
+        """Replace large values by blob references, writing the blobs."""
+        return self._offload(obj)
+
+    async def aoffload(self, obj: Any) -> Any:
+        """Like `offload()`, with the blob writes off the event loop."""
+        return await asyncio.to_thread(self._offload, obj)
+
+    def restore(self, obj: Any) -> Any:
+        """Replace blob references by their values, reading the blobs."""
+        return self._restore(obj)
+
+    async def arestore(self, obj: Any) -> Any:
+        """Like `restore()`, with the blob reads off the event loop."""
+        return await asyncio.to_thread(self._restore, obj)
+
+    def _offload(self, obj: Any) -> Any:
+        if isinstance(obj, str):
+            if len(obj) >= self.min_size:
+                return BLOB_REFERENCE_PREFIX_STR + self.blob_store.put(
+                    obj.encode("utf-8")
+                )
+            return obj
+        if isinstance(obj, bytes):
+            if len(obj) >= self.min_size:
+                return BLOB_REFERENCE_PREFIX_BYTES + self.blob_store.put(obj)
+            return obj
+        return self._map(obj, self._offload)
+
+    def _restore(self, obj: Any) -> Any:
+        if isinstance(obj, str):
+            if obj.startswith(BLOB_REFERENCE_PREFIX_STR):
+                return self.blob_store.get(
+                    obj.removeprefix(BLOB_REFERENCE_PREFIX_STR)
+                ).decode("utf-8")
+            if obj.startswith(BLOB_REFERENCE_PREFIX_BYTES):
+                return self.blob_store.get(obj.removeprefix(BLOB_REFERENCE_PREFIX_BYTES))
+            return obj
+        return self._map(obj, self._restore)
+
+    @staticmethod
+    def _map(obj: Any, function) -> Any:
+        """Apply the function to the items of containers and the fields of models.
+
+        Unchanged objects are returned as they are, so nothing is copied unless
+        it contains a value to offload or restore.
+        """
+        if isinstance(obj, list):
+            items = [function(item) for item in obj]
+            return items if any(a is not b for a, b in zip(items, obj)) else obj
+        if isinstance(obj, tuple) and not hasattr(obj, "_fields"):
+            items = tuple(function(item) for item in obj)
+            return items if any(a is not b for a, b in zip(items, obj)) else obj
+        if isinstance(obj, dict):
+            items = {key: function(value) for key, value in obj.items()}
+            return (
+                items
+                if any(items[key] is not value for key, value in obj.items())
+                else obj
+            )
+        if isinstance(obj, BaseModel):
+            # Covers messages (content blocks, tool artifacts) and tool output models.
+            update = {}
+            for field_name in type(obj).model_fields:
+                value = getattr(obj, field_name, None)
+                mapped_value = function(value)
+                if mapped_value is not value:
+                    update[field_name] = mapped_value
+            return obj.model_copy(update=update) if update else obj
+        return obj
+
+
+@cache
+def get_checkpoint_serializer() -> BlobOffloadingSerializer:
+    """Return the checkpoint serializer configured by `BLOB_DIR` and `CHECKPOINT_BLOB_MIN_SIZE`."""
+    return BlobOffloadingSerializer(
+        blob_store=get_blob_store(),
+        min_size=get_settings().checkpoint_blob_min_size,
+    )
+
+
+async def arestore_messages(messages: list[AnyMessage]) -> list[AnyMessage]:
+    """Restore the blob references in the message fields sent to the model.
+
+    Messages without references (e.g. all messages of checkpointers not using
+    the blob store) are returned as they are, without opening the blob store.
+    """
+    if not any(
+        contains_blob_reference(getattr(message, field_name, None))
+        for message in messages
+        for field_name in MESSAGE_FIELDS_TO_RESTORE
+    ):
+        return messages
+
+    serializer = get_checkpoint_serializer()
+
+    def _restore_messages() -> list[AnyMessage]:
+        restored_messages: list[AnyMessage] = []
+        for message in messages:
+            update = {}
+            for field_name in MESSAGE_FIELDS_TO_RESTORE:
+                value = getattr(message, field_name, None)
+                restored_value = serializer.restore(value)
+                if restored_value is not value:
+                    update[field_name] = restored_value
+            restored_messages.append(
+                message.model_copy(update=update) if update else message
+            )
+        return restored_messages
+
+    return await asyncio.to_thread(_restore_messages)
@@ -0,0 +1,28 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import InMemorySaver
+
+from config.settings import get_settings
+
+
+@asynccontextmanager
+async def generate_checkpointer() -> AsyncIterator[BaseCheckpointSaver]:
+    """Checkpointer of the LangGraph API server (`checkpointer.path` in `langgraph.json`).
+
+    Checkpoints are written to Postgres if `POSTGRES_DB_URI` is set, with
+    large values offloaded into the blob store (`BLOB_DIR`) like in `main.py`
+    and `batch.py`. Otherwise they are kept in memory, where offloading would
+    not save anything.
+    """
+    settings = get_settings()
+    if settings.postgres_db_uri:
+        # Imported on first use: the Postgres packages are only needed here.
+        from store.postgres import open_postgres
+
+        async with open_postgres(settings.postgres_db_uri) as (_, checkpointer, _):
+            yield checkpointer
+        return
+
+    yield InMemorySaver()
@@ -0,0 +1,114 @@
+from collections.abc import AsyncIterator, Sequence
+from contextlib import asynccontextmanager
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from langgraph.store.postgres import AsyncPostgresStore
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from pydantic import BaseModel
+
+from config.settings import get_settings
+from store.blobs import BlobOffloadingSerializer, get_checkpoint_serializer
+
+
+class PoolStats(BaseModel):
+    pool_size: int
+    pool_available: int
+    requests_waiting: int
+    requests_num: int
+    requests_wait_ms: int
+
+    @property
+    def average_wait_ms(self) -> float:
+        return self.requests_wait_ms / self.requests_num if self.requests_num > 0 else 0.0
+
+
+def get_pool_stats(pool: AsyncConnectionPool) -> PoolStats:
+    """Return the current size of the pool and how long requests waited for a connection."""
+    stats = pool.get_stats()
+    return PoolStats(
+        pool_size=stats.get("pool_size", 0),
+        pool_available=stats.get("pool_available", 0),
+        requests_waiting=stats.get("requests_waiting", 0),
+        requests_num=stats.get("requests_num", 0),
+        requests_wait_ms=stats.get("requests_wait_ms", 0),
+    )
+
+
+class BlobOffloadingPostgresSaver(AsyncPostgresSaver):
+    """Postgres checkpointer writing the blobs of large values off the event loop.
+
+    Values are offloaded in a thread before the checkpoint is serialized, so
+    the serializer only finds the blob references.
+    """
+
+    def __init__(self, conn: AsyncConnectionPool, serde: BlobOffloadingSerializer):
+        super().__init__(conn=conn, serde=serde)
+        self.blob_serde = serde
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        checkpoint = {
+            **checkpoint,
+            "channel_values": await self.blob_serde.aoffload(
+                checkpoint["channel_values"]
+            ),
+        }
+        return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        writes = await self.blob_serde.aoffload(list(writes))
+        await super().aput_writes(config, writes, task_id, task_path)
+
+
+@asynccontextmanager
+async def open_postgres(
+    db_uri: str,
+) -> AsyncIterator[
+    tuple[AsyncPostgresStore, BlobOffloadingPostgresSaver, AsyncConnectionPool]
+]:
+    """Open a connection pool shared by the store and the checkpointer.
+
+    Pool limits are configured with `POSTGRES_POOL_MIN_SIZE`, `POSTGRES_POOL_MAX_SIZE`
+    and `POSTGRES_POOL_TIMEOUT`. Statements are prepared on their first execution
+    per connection (`POSTGRES_PREPARE_THRESHOLD`), which covers the hot reference
+    lookups; store batches run in pipeline mode.
+    """
+    settings = get_settings()
+    async with AsyncConnectionPool(
+        conninfo=db_uri,
+        min_size=settings.postgres_pool_min_size,
+        max_size=settings.postgres_pool_max_size,
+        timeout=settings.postgres_pool_timeout,
+        # Same connection settings as `from_conn_string()`.
+        kwargs={
+            "autocommit": True,
+            "prepare_threshold": settings.postgres_prepare_threshold,
+            "row_factory": dict_row,
+        },
+        open=False,
+    ) as pool:
+        store = AsyncPostgresStore(conn=pool)
+        checkpointer = BlobOffloadingPostgresSaver(
+            conn=pool,
+            # Keep attachments and audio payloads out of the checkpoints.
+            serde=get_checkpoint_serializer(),
+        )
+        await store.setup()
+        await checkpointer.setup()
+
+        yield store, checkpointer, pool
@@ -1,67 +1,307 @@
-from langgraph.store.base import BaseStore
+import asyncio
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from hashlib import md5
+
+from langgraph.store.base import BaseStore, GetOp, Item, PutOp, SearchOp
+from langgraph.store.postgres import AsyncPostgresStore
+from psycopg_pool import AsyncConnectionPool
+
+from cache.artifacts import amark_referenced_artifacts, get_artifact_caches
+from telemetry.metrics import STORE_DURATION, STORE_ERRORS, observe
 
 REFERENCE_INDEX_KEY = "REF_INDEX"
 REFERENCE_KEY_TEMPLATE = "REF_{index}"
+# Number of references per user and direction kept in the in-process cache.
+REFERENCE_CACHE_SIZE = 1024
+# Page size to read all stored references (see `mark_stored_references()`).
+REFERENCE_PAGE_SIZE = 1000
 
 
-async def get_reference_key(store: BaseStore, user_id: str, value: str) -> str:
-    """Create and return a new reference key for given value or return the existing reference key."""
+class LRUCache:
+    """Minimal least-recently-used cache."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: OrderedDict[str, str] = OrderedDict()
+
+    def get(self, key: str) -> str | None:
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._items
+
+
+# References never change once allocated, so both directions can be cached.
+_reference_key_caches: dict[str, LRUCache] = {}
+_reference_value_caches: dict[str, LRUCache] = {}
+_allocation_locks: dict[str, asyncio.Lock] = {}
+_stored_references_lock = asyncio.Lock()
+_stored_references_marked = False
+
+
+def _reference_namespace(user_id: str) -> tuple[str, ...]:
+    return user_id, "references"
+
+
+def _reference_value_namespace(user_id: str) -> tuple[str, ...]:
+    """Namespace of the reverse index (value hash -> reference key)."""
+    return user_id, "reference_values"
+
+
+def _reference_value_key(value: str) -> str:
+    return md5(value.encode("utf-8")).hexdigest()
+
+
+def _advisory_lock_id(user_id: str) -> int:
+    """Return the Postgres advisory lock ID (signed 64-bit) of the reference allocation of the user."""
+    digest = md5(f"references:{user_id}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+@asynccontextmanager
+async def _allocation_lock(store: BaseStore, user_id: str) -> AsyncIterator[None]:
+    """Serialize the reference allocation of the user.
+
+    Within the process by an asyncio lock and, for a Postgres store on a
+    connection pool, across processes by a session advisory lock held on a
+    separate pool connection while the store is read and written.
+    """
+    async with _allocation_locks.setdefault(user_id, asyncio.Lock()):
+        if not (
+            isinstance(store, AsyncPostgresStore)
+            and isinstance(store.conn, AsyncConnectionPool)
+        ):
+            yield
+            return
+
+        lock_id = _advisory_lock_id(user_id)
+        async with store.conn.connection() as connection:
+            with observe(STORE_DURATION, STORE_ERRORS, operation="lock_reference_keys"):
+                await connection.execute("SELECT pg_advisory_lock(%s)", (lock_id,))
+            try:
+                yield
+            finally:
+                await connection.execute("SELECT pg_advisory_unlock(%s)", (lock_id,))
+
+
+def _get_key_cache(user_id: str) -> LRUCache:
+    return _reference_key_caches.setdefault(user_id, LRUCache(REFERENCE_CACHE_SIZE))
+
+
+def _get_value_cache(user_id: str) -> LRUCache:
+    return _reference_value_caches.setdefault(user_id, LRUCache(REFERENCE_CACHE_SIZE))
 
-    # Search for existing references.
-    namespace = (user_id, "references")
-    existing_reference = await store.asearch(
-        namespace,
-        filter={"value": value},
-        limit=1,
-    )
 
-    if len(existing_reference) == 0:
-        # If no reference for the given value exists, create new reference.
-        reference_index = 1
+async def get_reference_keys(
+    store: BaseStore, user_id: str, values: list[str]
+) -> list[str]:
+    """Return the reference keys for the given values, creating new ones where needed.
 
-        # Get reference index.
-        reference_index_item = await store.aget(namespace, REFERENCE_INDEX_KEY)
+    All uncached values are resolved in one store round trip and new keys are
+    written in a second one. Allocation is serialized per user (see
+    `_allocation_lock()`), so concurrent tool calls never hand out the same
+    reference key. Other stores than Postgres are only serialized within the
+    process, so they must not be shared by several processes.
+    """
+    await mark_stored_references(store)
+    key_cache = _get_key_cache(user_id)
 
-        # Setup reference index item, if it does not exist or is not an integer.
-        if reference_index_item is None or not isinstance(
-            reference_index_item.value["value"], int
+    # Renew the pins of the cached files of known references (new ones are
+    # pinned while resolving them).
+    if cached_values := [v for v in dict.fromkeys(values) if v in key_cache]:
+        await amark_referenced_artifacts(cached_values)
+
+    missing_values = list(dict.fromkeys(v for v in values if v not in key_cache))
+    if missing_values:
+        async with _allocation_lock(store, user_id):
+            # Another call may have resolved the values while waiting for the lock.
+            missing_values = [v for v in missing_values if v not in key_cache]
+            if missing_values:
+                await _resolve_reference_keys(store, user_id, missing_values)
+
+    return [key_cache.get(value) for value in values]
+
+
+async def _resolve_reference_keys(
+    store: BaseStore, user_id: str, values: list[str]
+):
+    """Look up or allocate the reference keys of the values and cache them (call under `_allocation_lock()`)."""
+    namespace = _reference_namespace(user_id)
+    value_namespace = _reference_value_namespace(user_id)
+    key_cache = _get_key_cache(user_id)
+    value_cache = _get_value_cache(user_id)
+
+    # Reverse index lookups and the reference index in a single round trip.
+    with observe(STORE_DURATION, STORE_ERRORS, operation="lookup_reference_keys"):
+        results = await store.abatch(
+            [
+                *[GetOp(value_namespace, _reference_value_key(v)) for v in values],
+                GetOp(namespace, REFERENCE_INDEX_KEY),
+            ]
+        )
+    reverse_items: list[Item | None] = results[: len(values)]
+    reference_index_item: Item | None = results[-1]
+
+    # Only values missing from the reverse index may have a reference created
+    # before it existed, found by a (filtered, so slower) search in a second
+    # round trip and backfilled into the reverse index below.
+    unindexed_values = [
+        value
+        for value, reverse_item in zip(values, reverse_items)
+        if reverse_item is None or reverse_item.value["value"] != value
+    ]
+    legacy_items_by_value: dict[str, list[Item]] = {}
+    if unindexed_values:
+        with observe(
+            STORE_DURATION, STORE_ERRORS, operation="search_legacy_reference_keys"
         ):
-            await store.aput(
-                namespace=namespace,
-                key=REFERENCE_INDEX_KEY,
-                value={"value": reference_index},
+            legacy_results = await store.abatch(
+                [
+                    SearchOp(namespace, filter={"value": v}, limit=1)
+                    for v in unindexed_values
+                ]
             )
+        legacy_items_by_value = dict(zip(unindexed_values, legacy_results))
+
+    # Get the current reference index, if it exists and is an integer.
+    reference_index = 0
+    if reference_index_item is not None and isinstance(
+        reference_index_item.value["value"], int
+    ):
+        reference_index = reference_index_item.value["value"]
+
+    resolved: dict[str, str] = {}
+    put_ops: list[PutOp] = []
+    for value, reverse_item in zip(values, reverse_items):
+        if value not in legacy_items_by_value:
+            resolved[value] = reverse_item.value["key"]
+            continue
+
+        legacy_items = legacy_items_by_value[value]
+        if len(legacy_items) > 0:
+            reference_key = legacy_items[0].key
         else:
-            # Get next reference index.
-            reference_index = int(reference_index_item.value["value"]) + 1
-            # Update reference index item with next index.
-            await store.aput(
-                namespace=namespace,
-                key=REFERENCE_INDEX_KEY,
-                value={"value": reference_index},
+            # If no reference for the given value exists, create new reference.
+            reference_index += 1
+            reference_key = REFERENCE_KEY_TEMPLATE.format(index=reference_index)
+            put_ops.append(PutOp(namespace, reference_key, {"value": value}))
+        put_ops.append(
+            PutOp(
+                value_namespace,
+                _reference_value_key(value),
+                {"key": reference_key, "value": value},
             )
+        )
+        resolved[value] = reference_key
 
-        # Save new reference.
-        reference_key = REFERENCE_KEY_TEMPLATE.format(index=reference_index)
-        await store.aput(
-            namespace=namespace,
-            key=reference_key,
-            value={"value": value},
+    # Pin the cached files the references point to, before the references
+    # exist, so a failed write at most pins a file too many.
+    await amark_referenced_artifacts(list(resolved))
+
+    if put_ops:
+        put_ops.append(
+            PutOp(namespace, REFERENCE_INDEX_KEY, {"value": reference_index})
         )
+        with observe(STORE_DURATION, STORE_ERRORS, operation="put_reference_keys"):
+            await store.abatch(put_ops)
 
-        return reference_key
+    # Only cache references once they are persisted.
+    for value, reference_key in resolved.items():
+        key_cache.put(value, reference_key)
+        value_cache.put(reference_key, value)
 
-    else:
-        # Return the existing reference key for the given value.
-        return existing_reference[0].key
 
+async def mark_stored_references(store: BaseStore):
+    """Mark the cached files of all stored references as referenced, once per process.
 
-async def get_reference_value(store: BaseStore, user_id: str, key: str) -> str | None:
-    """Return the value for the given reference key."""
+    Only needed for artifact caches indexed before references were marked
+    (see `cache.artifacts.ArtifactCache.references_tracked`), which don't
+    evict any file until then. Other calls return right away.
+    """
+    global _stored_references_marked
+    if _stored_references_marked:
+        return
+
+    async with _stored_references_lock:
+        if _stored_references_marked:
+            return
+        # Opening the caches may index their files, so off the event loop.
+        artifact_caches = await asyncio.to_thread(
+            lambda: [
+                artifact_cache
+                for artifact_cache in get_artifact_caches()
+                if not artifact_cache.references_tracked
+            ]
+        )
+        if artifact_caches:
+            values: list[str] = []
+            with observe(STORE_DURATION, STORE_ERRORS, operation="list_references"):
+                namespaces: list[tuple[str, ...]] = []
+                while page := await store.alist_namespaces(
+                    suffix=("references",),
+                    limit=REFERENCE_PAGE_SIZE,
+                    offset=len(namespaces),
+                ):
+                    namespaces.extend(page)
+                for namespace in namespaces:
+                    offset = 0
+                    while items := await store.asearch(
+                        namespace, limit=REFERENCE_PAGE_SIZE, offset=offset
+                    ):
+                        values.extend(
+                            item.value["value"]
+                            for item in items
+                            if item.key != REFERENCE_INDEX_KEY
+                        )
+                        offset += len(items)
+            await amark_referenced_artifacts(values)
+            for artifact_cache in artifact_caches:
+                await asyncio.to_thread(artifact_cache.mark_references_tracked)
+            print(f"Marked the cached files of {len(values)} stored reference(s).")
+        _stored_references_marked = True
+
+
+async def get_reference_values(
+    store: BaseStore, user_id: str, keys: list[str]
+) -> list[str | None]:
+    """Return the values for the given reference keys (`None` for unknown keys) in one store round trip."""
+    key_cache = _get_key_cache(user_id)
+    value_cache = _get_value_cache(user_id)
+
+    missing_keys = list(dict.fromkeys(k for k in keys if k not in value_cache))
+    if missing_keys:
+        with observe(STORE_DURATION, STORE_ERRORS, operation="get_reference_values"):
+            items: list[Item | None] = await store.abatch(
+                [GetOp(_reference_namespace(user_id), key) for key in missing_keys]
+            )
+        for key, item in zip(missing_keys, items):
+            if item is not None:
+                value_cache.put(key, item.value["value"])
+                key_cache.put(item.value["value"], key)
+
+    values = [value_cache.get(key) for key in keys]
+    # Files in use are pinned again for the full period.
+    if resolved_values := list(dict.fromkeys(v for v in values if v is not None)):
+        await amark_referenced_artifacts(resolved_values)
+    return values
 
-    reference_item = await store.aget(
-        namespace=(user_id, "references"),
-        key=key,
-    )
 
-    return reference_item.value["value"] if reference_item is not None else None
+async def get_reference_key(store: BaseStore, user_id: str, value: str) -> str:
+    """Create and return a new reference key for given value or return the existing reference key."""
+    return (await get_reference_keys(store, user_id, [value]))[0]
+
+
+async def get_reference_value(store: BaseStore, user_id: str, key: str) -> str | None:
+    """Return the value for the given reference key."""
+    return (await get_reference_values(store, user_id, [key]))[0]
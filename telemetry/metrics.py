@@ -0,0 +1,159 @@
+import functools
+import inspect
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from telemetry.sidecar import start_metrics_sidecar
+
+# Latency buckets from cache hits (milliseconds) up to long generations (minutes).
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300,
+)
+
+NODE_DURATION = Histogram(
+    "locallm_node_duration_seconds",
+    "Duration of graph node runs.",
+    ["node"],
+    buckets=LATENCY_BUCKETS,
+)
+NODE_ERRORS = Counter(
+    "locallm_node_errors_total",
+    "Graph node runs that raised an error.",
+    ["node"],
+)
+TOOL_DURATION = Histogram(
+    "locallm_tool_duration_seconds",
+    "Duration of tool calls, including the time their requests waited for a backend slot.",
+    ["tool", "backend"],
+    buckets=LATENCY_BUCKETS,
+)
+TOOL_QUEUE_WAIT = Histogram(
+    "locallm_tool_queue_wait_seconds",
+    "Time the requests of tool calls waited for a free slot of their backend, summed per call.",
+    ["tool", "backend"],
+    buckets=LATENCY_BUCKETS,
+)
+BACKEND_QUEUE_WAIT = Histogram(
+    "locallm_backend_queue_wait_seconds",
+    "Time requests waited for a free slot of their backend.",
+    ["backend"],
+    buckets=LATENCY_BUCKETS,
+)
+TOOL_ERRORS = Counter(
+    "locallm_tool_errors_total",
+    "Tool calls that raised an error.",
+    ["tool", "backend"],
+)
+STORE_DURATION = Histogram(
+    "locallm_store_duration_seconds",
+    "Duration of store round trips of the reference helpers.",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+STORE_ERRORS = Counter(
+    "locallm_store_errors_total",
+    "Store round trips of the reference helpers that raised an error.",
+    ["operation"],
+)
+PLAYBACK_REQUEST_DURATION = Histogram(
+    "locallm_playback_request_duration_seconds",
+    "Duration of HTTP requests to the audio playback service.",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+PLAYBACK_REQUEST_ERRORS = Counter(
+    "locallm_playback_request_errors_total",
+    "HTTP requests to the audio playback service that failed.",
+    ["operation"],
+)
+TTS_TIME_TO_FIRST_AUDIO = Histogram(
+    "locallm_tts_time_to_first_audio_seconds",
+    "Time from a speak request (TTS with a playback queue) until its first audio is handed to playback.",
+    ["mode"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS = Counter(
+    "locallm_http_requests_total",
+    "Requests sent by the shared HTTP clients.",
+    ["client"],
+)
+HTTP_CONNECTIONS_OPENED = Counter(
+    "locallm_http_connections_opened_total",
+    "Connections opened by the shared HTTP clients (requests minus these reused a connection).",
+    ["client"],
+)
+HTTP_RETRIES = Counter(
+    "locallm_http_retries_total",
+    "Retried requests of the shared HTTP clients.",
+    ["client", "method"],
+)
+LLM_REQUESTS = Counter(
+    "locallm_llm_requests_total",
+    "Streamed LLM requests, including the ones served by an identical in-flight request.",
+    ["model"],
+)
+LLM_COALESCED_REQUESTS = Counter(
+    "locallm_llm_coalesced_requests_total",
+    "LLM requests served by an identical in-flight request instead of their own generation.",
+    ["model"],
+)
+CACHE_REQUESTS = Counter(
+    "locallm_cache_requests_total",
+    "Cache lookups of the TTS, STT and attachment reuse paths.",
+    ["cache", "result"],
+)
+ARTIFACT_CACHE_BYTES = Gauge(
+    "locallm_artifact_cache_bytes",
+    "Size of the files of an artifact cache, in total and pinned by references (included in the quota).",
+    ["directory", "state"],
+)
+
+
+@contextmanager
+def observe(histogram: Histogram, errors: Counter, **labels: str) -> Iterator[None]:
+    """Record the duration of the block and count it as error if it raises."""
+    start_time = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        errors.labels(**labels).inc()
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start_time)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def timed_node(node: str) -> Callable[[Callable], Callable]:
+    """Decorate a graph node to record its duration and errors.
+
+    The wrapper keeps the signature of the node, so LangGraph still injects
+    `config` and `runtime`. The first node run of the process starts the
+    metrics sidecar.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                start_metrics_sidecar()
+                with observe(NODE_DURATION, NODE_ERRORS, node=node):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start_metrics_sidecar()
+            with observe(NODE_DURATION, NODE_ERRORS, node=node):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,28 @@
+from prometheus_client import start_http_server
+
+from config.settings import get_settings
+
+_started = False
+
+
+def start_metrics_sidecar():
+    """Serve the metrics of this process on `GRAPH_METRICS_PORT` (if set), once per process.
+
+    Called on the first graph node run (see `telemetry.metrics.timed_node()`),
+    so importing the graph (e.g. by tools or tests) never binds the port.
+    """
+    global _started
+    if _started:
+        return
+    # Only attempted once, also if the port is taken.
+    _started = True
+    settings = get_settings()
+    if settings.graph_metrics_port is None:
+        return
+
+    try:
+        start_http_server(settings.graph_metrics_port, addr=settings.graph_metrics_host)
+        print(f"Serving graph metrics on port {settings.graph_metrics_port}.")
+    except OSError as e:
+        # E.g. another worker of the same server already serves them.
+        print(f"Could not serve graph metrics on port {settings.graph_metrics_port}: {e}")
@@ -0,0 +1,164 @@
+import struct
+from pathlib import Path
+
+import numpy as np
+import soundfile
+
+# Frames copied per block when concatenating.
+AUDIO_BLOCK_FRAMES = 65536
+# Sample types read and written unchanged, so PCM is copied without conversion.
+SUBTYPE_DTYPES = {
+    "PCM_16": "int16",
+    "PCM_24": "int32",
+    "PCM_32": "int32",
+    "FLOAT": "float32",
+    "DOUBLE": "float64",
+}
+# WAV format tags of integer PCM and float samples (`WAVE_FORMAT_EXTENSIBLE` names it in its sub format).
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# Sample types that can be mapped from the file as they are.
+WAVE_SAMPLE_DTYPES = {
+    (WAVE_FORMAT_PCM, 16): "<i2",
+    (WAVE_FORMAT_PCM, 32): "<i4",
+    (WAVE_FORMAT_IEEE_FLOAT, 32): "<f4",
+    (WAVE_FORMAT_IEEE_FLOAT, 64): "<f8",
+}
+
+
+def concatenate_wav(input_file_paths: list[str], output_file_path: Path):
+    """Concatenate the PCM of WAV files with the same format into one WAV file.
+
+    The samples are copied block by block into the output file, without
+    decoding them to another sample type or writing intermediate files.
+    """
+    with soundfile.SoundFile(input_file_paths[0]) as first_input:
+        samplerate = first_input.samplerate
+        channels = first_input.channels
+        subtype = first_input.subtype
+    dtype = SUBTYPE_DTYPES.get(subtype, "float32")
+
+    with soundfile.SoundFile(
+        output_file_path,
+        "w",
+        samplerate=samplerate,
+        channels=channels,
+        subtype=subtype,
+        format="WAV",
+    ) as output:
+        for input_file_path in input_file_paths:
+            with soundfile.SoundFile(input_file_path) as audio_input:
+                if (audio_input.samplerate, audio_input.channels) != (
+                    samplerate,
+                    channels,
+                ):
+                    raise ValueError(
+                        f"Can't concatenate audio of different formats: {input_file_path}"
+                    )
+                for block in audio_input.blocks(AUDIO_BLOCK_FRAMES, dtype=dtype):
+                    output.write(block)
+
+
+def _map_wav(file_path: str) -> tuple[np.ndarray, int]:
+    """Return the samples (frames x channels) and sample rate of a WAV file, memory-mapped if possible.
+
+    Files with sample types that can't be mapped (e.g. 24 bit) are read instead.
+    """
+    with open(file_path, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError(f"Not a WAV file: {file_path}")
+        format_tag = channels = samplerate = bits_per_sample = None
+        while header := f.read(8):
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt = f.read(chunk_size)
+                format_tag, channels, samplerate = struct.unpack("<HHI", fmt[:8])
+                bits_per_sample = struct.unpack("<H", fmt[14:16])[0]
+                if format_tag == WAVE_FORMAT_EXTENSIBLE:
+                    format_tag = struct.unpack("<H", fmt[24:26])[0]
+                f.seek(chunk_size % 2, 1)
+            elif chunk_id == b"data":
+                dtype = WAVE_SAMPLE_DTYPES.get((format_tag, bits_per_sample))
+                if dtype is None:
+                    break
+                offset = f.tell()
+                # Streamed WAVs may carry a placeholder size; the file size is authoritative.
+                f.seek(0, 2)
+                size = min(chunk_size, f.tell() - offset)
+                frame_size = np.dtype(dtype).itemsize * channels
+                samples = np.memmap(
+                    file_path,
+                    dtype=dtype,
+                    mode="r",
+                    offset=offset,
+                    shape=(size // frame_size, channels),
+                )
+                return samples, samplerate
+            else:
+                f.seek(chunk_size + chunk_size % 2, 1)
+
+    samples, samplerate = soundfile.read(file_path, dtype="float32", always_2d=True)
+    return samples, samplerate
+
+
+def _convert_samples(samples: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """Convert samples to the sample type, scaling integer samples to and from the float range [-1, 1)."""
+    if samples.dtype == dtype:
+        return samples
+    if np.issubdtype(samples.dtype, np.integer):
+        float_samples = samples.astype(np.float64) / -float(np.iinfo(samples.dtype).min)
+    else:
+        float_samples = samples.astype(np.float64)
+    if np.issubdtype(dtype, np.floating):
+        return float_samples.astype(dtype)
+    limits = np.iinfo(dtype)
+    return np.clip(
+        np.round(float_samples * -float(limits.min)), limits.min, limits.max
+    ).astype(dtype)
+
+
+def mix_dialogue(
+    input_file_paths: list[str], output_file_path: Path, pause_seconds: float
+):
+    """Render WAV files one after another into a single WAV file, separated by silence.
+
+    The inputs are memory-mapped and written to the output as they are, so
+    the parts aren't loaded into memory as a whole. The output has the sample
+    type of the first input; the blocks of inputs with another sample type are
+    converted to it (see `_convert_samples()`).
+    """
+    first_samples, samplerate = _map_wav(input_file_paths[0])
+    channels = first_samples.shape[1]
+    with soundfile.SoundFile(input_file_paths[0]) as first_input:
+        subtype = first_input.subtype
+    silence = np.zeros(
+        (round(pause_seconds * samplerate), channels), dtype=first_samples.dtype
+    )
+
+    with soundfile.SoundFile(
+        output_file_path,
+        "w",
+        samplerate=samplerate,
+        channels=channels,
+        subtype=subtype,
+        format="WAV",
+    ) as output:
+        for index, input_file_path in enumerate(input_file_paths):
+            samples, input_samplerate = (
+                (first_samples, samplerate) if index == 0 else _map_wav(input_file_path)
+            )
+            if (input_samplerate, samples.shape[1]) != (samplerate, channels):
+                raise ValueError(
+                    f"Can't mix audio of different formats: {input_file_path}"
+                )
+            if index > 0 and len(silence):
+                output.write(silence)
+            for offset in range(0, len(samples), AUDIO_BLOCK_FRAMES):
+                output.write(
+                    _convert_samples(
+                        samples[offset : offset + AUDIO_BLOCK_FRAMES],
+                        first_samples.dtype,
+                    )
+                )
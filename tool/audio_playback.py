@@ -1,75 +1,113 @@
-import os
+from collections.abc import AsyncIterator
+from contextlib import nullcontext
 
 import httpx
-from dotenv import load_dotenv
 from langchain_core.messages import ToolMessage
 from langchain_core.tools import tool
 from langgraph.prebuilt import ToolRuntime
 from langgraph.types import Command
 from pydantic import BaseModel, Field
 
-from store.references import get_reference_value, get_reference_key
+from client.backends import Backend, backend_slot
+from client.http import get_http_timeout, request
+from config.settings import get_settings
+from store.references import get_reference_key, get_reference_values
+from telemetry.metrics import (
+    PLAYBACK_REQUEST_DURATION,
+    PLAYBACK_REQUEST_ERRORS,
+    observe,
+)
 
-load_dotenv()
 
-base_url = os.getenv("API_BASE_URL_AUDIO_PLAYBACK")
+# --- Pure HTTP logic (no LangGraph awareness) ---
 
 
-# --- Pure HTTP logic (no LangGraph awareness) ---
+def _base_url() -> str | None:
+    return get_settings().api_base_url_audio_playback
+
+
+async def _request(
+    operation: str, method: str, path: str, slot: bool = True, **kwargs
+) -> httpx.Response:
+    """Send a request to the playback service over the shared keep-alive client.
+
+    Requests hold a `Backend.PLAYBACK` slot, unless `slot` is unset.
+    """
+    async with backend_slot(Backend.PLAYBACK) if slot else nullcontext():
+        with observe(
+            PLAYBACK_REQUEST_DURATION, PLAYBACK_REQUEST_ERRORS, operation=operation
+        ):
+            response = await request(
+                "playback", method, f"{_base_url()}{path}", **kwargs
+            )
+            response.raise_for_status()
+    return response
 
 
 async def _play_audio(queue_name: str, file_paths: list[str], volume: float = 1.0) -> dict:
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{base_url}/queues/{queue_name}",
-            json={"files": file_paths, "volume": volume},
-        )
-    response.raise_for_status()
+    response = await _request(
+        "play",
+        "POST",
+        f"/queues/{queue_name}",
+        json={"files": file_paths, "volume": volume},
+    )
+    return response.json()
+
+
+async def _stream_audio(
+    queue_name: str, chunks: AsyncIterator[bytes], volume: float | None = None
+) -> dict:
+    """Stream audio to a queue, where it starts playing with the first chunk.
+
+    The request lasts as long as the generation of the chunks, so it holds no
+    playback slot (that would block the other playback requests meanwhile) and
+    waits up to `HTTP_INFERENCE_TIMEOUT` for each chunk and the response.
+    """
+    response = await _request(
+        "stream",
+        "POST",
+        f"/queues/{queue_name}/stream",
+        slot=False,
+        params={"volume": volume} if volume is not None else None,
+        content=chunks,
+        headers={"Content-Type": "audio/wav"},
+        timeout=get_http_timeout(get_settings().http_inference_timeout),
+    )
     return response.json()
 
 
 async def _list_queues() -> list[dict]:
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{base_url}/queues")
-    response.raise_for_status()
+    response = await _request("list_queues", "GET", "/queues")
     return response.json()
 
 
 async def _get_queue_status(queue_name: str) -> dict:
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{base_url}/queues/{queue_name}")
-    response.raise_for_status()
+    response = await _request("get_queue_status", "GET", f"/queues/{queue_name}")
     return response.json()
 
 
 async def _stop_queue(queue_name: str) -> dict:
-    async with httpx.AsyncClient() as client:
-        response = await client.delete(f"{base_url}/queues/{queue_name}")
-    response.raise_for_status()
+    response = await _request("stop_queue", "DELETE", f"/queues/{queue_name}")
     return response.json()
 
 
 async def _stop_all_queues() -> dict:
-    async with httpx.AsyncClient() as client:
-        response = await client.delete(f"{base_url}/queues")
-    response.raise_for_status()
+    response = await _request("stop_all_queues", "DELETE", "/queues")
     return response.json()
 
 
 async def _set_volume(queue_name: str, volume: float) -> dict:
-    async with httpx.AsyncClient() as client:
-        response = await client.put(
-            f"{base_url}/queues/{queue_name}/volume",
-            json={"volume": volume},
-        )
-    response.raise_for_status()
+    response = await _request(
+        "set_volume",
+        "PUT",
+        f"/queues/{queue_name}/volume",
+        json={"volume": volume},
+    )
     return response.json()
 
 
 async def _skip_track(queue_name: str) -> dict:
-    async with httpx.AsyncClient() as client:
-        response = await client.post(f"{base_url}/queues/{queue_name}/skip")
-    response.raise_for_status()
+    response = await _request("skip_track", "POST", f"/queues/{queue_name}/skip")
     return response.json()
 
 
@@ -128,13 +166,12 @@ async def play_audio_queue(
         return Command(update={"messages": [tool_error_message]})
 
     # Resolve reference keys to actual file paths.
-    file_paths: list[str] = []
-    for ref in file_path_refs:
-        path = await get_reference_value(
-            runtime.store,
-            runtime.config["configurable"]["context"]["user_id"],
-            ref,
-        )
+    file_paths = await get_reference_values(
+        runtime.store,
+        runtime.config["configurable"]["context"]["user_id"],
+        file_path_refs,
+    )
+    for ref, path in zip(file_path_refs, file_paths):
         if path is None:
             tool_message = ToolMessage(
                 content=f"Reference '{ref}' not found.",
@@ -143,7 +180,6 @@ async def play_audio_queue(
             )
             tool_message.pretty_print()
             return Command(update={"messages": [tool_message]})
-        file_paths.append(path)
 
     status = await _play_audio(queue_name, file_paths, volume)
 
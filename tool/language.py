@@ -1,23 +1,36 @@
-import os
+import asyncio
+import re
+from collections.abc import Callable
+from functools import cache
 
-from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
 from langgraph.prebuilt import ToolRuntime
 from langgraph.types import Command
 from pydantic import BaseModel, Field, SecretStr
 
-load_dotenv()
+from cache.translations import get_translation_cache, get_translation_key
+from client.backends import Backend
+from client.coalescing import CoalescingChatOpenAI
+from config.settings import get_settings
+from telemetry.metrics import record_cache_lookup
+from tool.text import get_sentencizer
 
-general_model = ChatOpenAI(
-    base_url=os.getenv("API_BASE_URL_MLX_LM"),
-    api_key=SecretStr("none"),
-    model=os.getenv("MODEL_GENERAL"),
-    streaming=True,
-    temperature=0,
-    max_tokens=4096,
-)
+# Blank lines separating paragraphs.
+PARAGRAPH_SEPARATOR_PATTERN = re.compile(r"(\n\s*\n)")
+
+
+@cache
+def get_general_model() -> CoalescingChatOpenAI:
+    return CoalescingChatOpenAI(
+        base_url=get_settings().api_base_url_mlx_lm,
+        api_key=SecretStr("none"),
+        model=get_settings().model_general,
+        streaming=True,
+        temperature=0,
+        max_tokens=4096,
+        backend=Backend.MLX_LM,
+    )
 
 
 class TranslateInput(BaseModel):
@@ -32,23 +45,70 @@ class TranslateInput(BaseModel):
 
 
 class TranslationGeneration(BaseModel):
+    cached: bool
     input_text: str
-    input_language: str
+    input_language: str | None
+    model: str
     output_text: str
     output_language: str
+    chunk_count: int = 1
 
 
-@tool(
-    "translate_text",
-    description="Translates text from one language to another.",
-    args_schema=TranslateInput,
-)
-async def translate_text(
+class TextChunk(BaseModel):
+    text: str
+    # Whitespace following the chunk in the input, kept when reassembling.
+    separator: str
+
+
+def split_text(text: str, max_chars: int) -> list[TextChunk]:
+    """Split the text at paragraph and sentence boundaries into chunks of at most `max_chars` characters.
+
+    Paragraphs are only split into sentences if they are too long, and
+    consecutive pieces are packed into chunks as large as possible. A single
+    sentence longer than `max_chars` becomes a chunk of its own.
+    """
+    parts = PARAGRAPH_SEPARATOR_PATTERN.split(text.strip())
+    pieces: list[tuple[str, str]] = []
+    for paragraph, separator in zip(parts[::2], [*parts[1::2], ""]):
+        if len(paragraph) <= max_chars:
+            pieces.append((paragraph, separator))
+            continue
+        sentences = [
+            sentence.text_with_ws for sentence in get_sentencizer()(paragraph).sents
+        ]
+        for i, sentence in enumerate(sentences):
+            stripped_sentence = sentence.rstrip()
+            whitespace = sentence[len(stripped_sentence) :]
+            pieces.append(
+                (
+                    stripped_sentence,
+                    whitespace + separator if i == len(sentences) - 1 else whitespace,
+                )
+            )
+
+    chunks: list[TextChunk] = []
+    current_text = ""
+    current_separator = ""
+    for piece, separator in pieces:
+        if current_text and (
+            len(current_text) + len(current_separator) + len(piece) > max_chars
+        ):
+            chunks.append(TextChunk(text=current_text, separator=current_separator))
+            current_text = ""
+        current_text = (
+            current_text + current_separator + piece if current_text else piece
+        )
+        current_separator = separator
+    if current_text:
+        chunks.append(TextChunk(text=current_text, separator=current_separator))
+    return chunks
+
+
+async def translate(
     input_text: str,
     input_language: str | None,
     output_language: str,
-    runtime: ToolRuntime,
-) -> Command:
+) -> str:
     system_message = SystemMessage(
         content="\n".join(
             [
@@ -71,11 +131,144 @@ async def translate_text(
     )
 
     messages = [system_message, HumanMessage(content="\n".join(prompt_message_lines))]
-    response: AIMessage = await general_model.ainvoke(input=messages)
+    response: AIMessage = await get_general_model().ainvoke(input=messages)
+    return response.text.strip()
+
+
+async def generate_chunk_translation(
+    input_text: str,
+    input_language: str | None,
+    output_language: str,
+) -> TranslationGeneration:
+    """Translate the text in a single request (or take it from the cache)."""
+    model = get_general_model().model_name
+
+    # Allow caching of translations.
+    translation_cache = get_translation_cache()
+    translation_key = get_translation_key(
+        model, input_language, output_language, input_text
+    )
+    output_text = None
+    if translation_cache is not None:
+        output_text = await translation_cache.aget(translation_key)
+        record_cache_lookup("translation", output_text is not None)
+    use_cached_translation = output_text is not None
+
+    if use_cached_translation:
+        print("Using cached translation:", output_language, f'"{input_text[:32]}"')
+    else:
+        output_text = await translate(input_text, input_language, output_language)
+        if translation_cache is not None:
+            await translation_cache.aput(
+                translation_key, model, input_language, output_language, output_text
+            )
+
+    return TranslationGeneration(
+        cached=use_cached_translation,
+        input_text=input_text,
+        input_language=input_language,
+        model=model,
+        output_text=output_text,
+        output_language=output_language,
+    )
+
+
+async def generate_translation(
+    input_text: str,
+    input_language: str | None,
+    output_language: str,
+    on_chunk: Callable[[int, int, str], None] | None = None,
+) -> TranslationGeneration:
+    """Translate the text, splitting long texts into chunks translated concurrently.
+
+    Chunks are limited by `TRANSLATION_CHUNK_MAX_CHARS`, keeping each response
+    well within the `max_tokens` of the model, and up to
+    `TRANSLATION_CHUNK_CONCURRENCY` chunks are translated at a time.
+    `on_chunk(index, count, output_text)` is called for each chunk in order,
+    as soon as it and all chunks before it are translated.
+    """
+    settings = get_settings()
+    # The sentencizer runs off the event loop, like the TTS sentence splitting.
+    chunks = await asyncio.to_thread(
+        split_text, input_text, settings.translation_chunk_max_chars
+    )
+    if len(chunks) <= 1:
+        generation = await generate_chunk_translation(
+            input_text, input_language, output_language
+        )
+        if on_chunk is not None:
+            on_chunk(0, 1, generation.output_text)
+        return generation
+
+    semaphore = asyncio.Semaphore(settings.translation_chunk_concurrency)
+
+    async def _translate_chunk(chunk: TextChunk) -> TranslationGeneration:
+        async with semaphore:
+            return await generate_chunk_translation(
+                chunk.text, input_language, output_language
+            )
+
+    tasks = [asyncio.create_task(_translate_chunk(chunk)) for chunk in chunks]
+    generations: list[TranslationGeneration] = []
+    try:
+        # Await in order, so chunks are handed out in order while later ones are still running.
+        for index, task in enumerate(tasks):
+            generation = await task
+            generations.append(generation)
+            if on_chunk is not None:
+                on_chunk(index, len(chunks), generation.output_text)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    print(f"Translated {len(chunks)} chunks of {len(input_text)} characters.")
+    return TranslationGeneration(
+        cached=all(generation.cached for generation in generations),
+        input_text=input_text,
+        input_language=input_language,
+        model=generations[0].model,
+        output_text="".join(
+            generation.output_text + chunk.separator
+            for generation, chunk in zip(generations, chunks)
+        ).strip(),
+        output_language=output_language,
+        chunk_count=len(chunks),
+    )
+
+
+@tool(
+    "translate_text",
+    description="Translates text from one language to another.",
+    args_schema=TranslateInput,
+)
+async def translate_text(
+    input_text: str,
+    input_language: str | None,
+    output_language: str,
+    runtime: ToolRuntime,
+) -> Command:
+    def _stream_chunk(index: int, count: int, output_text: str):
+        # Stream the translation chunk by chunk (`stream_mode="custom"`).
+        runtime.stream_writer(
+            {
+                "tool_call_id": runtime.tool_call_id,
+                "translation_chunk": {
+                    "index": index,
+                    "count": count,
+                    "text": output_text,
+                },
+            }
+        )
+
+    generation = await generate_translation(
+        input_text, input_language, output_language, on_chunk=_stream_chunk
+    )
 
     tool_message = ToolMessage(
-        content=response.text.strip(),
+        content=generation.output_text,
         tool_call_id=runtime.tool_call_id,
+        artifact=generation,
     )
     tool_message.pretty_print()
     return Command(update={"messages": [tool_message]})
@@ -1,10 +1,8 @@
-import fnmatch
-import os
+import asyncio
 import time
 from hashlib import md5
 from pathlib import Path
 
-from dotenv import load_dotenv
 from langchain_core.messages import ToolMessage
 from langchain_core.tools import tool
 from langgraph.prebuilt import ToolRuntime
@@ -12,14 +10,18 @@ from langgraph.types import Command
 from openai import AsyncOpenAI
 from pydantic import BaseModel, Field
 
-from store.references import get_reference_value, get_reference_key
+from cache.artifacts import ArtifactCache, ArtifactKind, get_artifact_cache
+from cache.file_hashes import get_file_hash_index
+from client.backends import Backend, backend_slot
+from client.http import get_openai_client
+from config.settings import get_settings
+from store.references import get_reference_keys, get_reference_values
+from telemetry.metrics import record_cache_lookup
 
-load_dotenv()
 
-openai_client = AsyncOpenAI(
-    api_key="none",
-    base_url=os.getenv("API_BASE_URL_MLX_AUDIO"),
-)
+def get_audio_client() -> AsyncOpenAI:
+    # Shares the keep-alive connections and timeouts of the other mlx-audio calls.
+    return get_openai_client("mlx_audio", get_settings().api_base_url_mlx_audio)
 
 
 class TranscriptionINput(BaseModel):
@@ -33,6 +35,13 @@ class TranscriptionFileObject(BaseModel):
     language: str
 
 
+class TranscriptionTimings(BaseModel):
+    hash_seconds: float
+    cache_lookup_seconds: float
+    # Upload and inference of the transcription request (0 if cached).
+    transcription_seconds: float = 0.0
+
+
 class TranscriptionGeneration(BaseModel):
     audio_file_path: str
     cached: bool
@@ -40,6 +49,12 @@ class TranscriptionGeneration(BaseModel):
     model: str
     text_content: str
     text_file_path: str
+    timings: TranscriptionTimings
+
+
+class TranscriptionGenerationError(BaseModel):
+    audio_file_path: str
+    error: str
 
 
 class TranscriptionGenerationArtifact(BaseModel):
@@ -49,93 +64,121 @@ class TranscriptionGenerationArtifact(BaseModel):
     model: str
     text_content: str
     text_file_path_ref: str
+    timings: TranscriptionTimings
 
 
-async def transcribe_audio(
-    audio_file_paths: list[str],
-) -> list[TranscriptionGeneration]:
-    model = os.getenv("MODEL_STT")
+async def _transcribe_file(
+    model: str,
+    audio_file_path: str,
+    artifact_cache: ArtifactCache,
+) -> TranscriptionGeneration:
+    # Allow caching of created transcription files.
+    # Hash the audio input file content (unless unchanged since it was last hashed).
+    start_time = time.perf_counter()
+    try:
+        audio_file_content_hash, _ = await get_file_hash_index().ahash_file(
+            audio_file_path
+        )
+    except Exception as e:
+        raise IOError(f"There was an error reading the input audio file: {e}")
+    hash_seconds = time.perf_counter() - start_time
 
-    generations: list[TranscriptionGeneration] = []
-    for audio_file_path in audio_file_paths:
-        # Allow caching of created transcription files.
+    generation_hash = md5(
+        f"{model}-{audio_file_content_hash}".encode("utf-8")
+    ).hexdigest()
+    # Search for an already created transcription file.
+    start_time = time.perf_counter()
+    transcription_file_path = await artifact_cache.alookup(generation_hash)
+    use_cached_file = transcription_file_path is not None
+    if use_cached_file:
+        print("Using cached file...")
         try:
-            with open(audio_file_path, "rb") as audio_file:
-                audio_file_content = audio_file.read()
+            with open(transcription_file_path, "r") as transcription_file:
+                transcription_file_object = TranscriptionFileObject.model_validate_json(
+                    transcription_file.read()
+                )
+        except Exception as e:
+            raise IOError(f"There was an error reading the transcription file: {e}")
+    record_cache_lookup("stt", use_cached_file)
+    timings = TranscriptionTimings(
+        hash_seconds=hash_seconds,
+        cache_lookup_seconds=time.perf_counter() - start_time,
+    )
+
+    if not use_cached_file:
+        transcription_file_path = artifact_cache.path_for(generation_hash, ".json")
+        # Transcription request, streaming the upload from the file.
+        start_time = time.perf_counter()
+        try:
+            audio_file = open(audio_file_path, "rb")
         except Exception as e:
             raise IOError(f"There was an error reading the input audio file: {e}")
+        with audio_file:
+            async with (
+                backend_slot(Backend.MLX_AUDIO),
+                get_audio_client().audio.transcriptions.with_streaming_response.create(
+                    model=model,
+                    file=(Path(audio_file_path).name, audio_file),
+                ) as response,
+            ):
+                response_json = await response.json()
+        timings.transcription_seconds = time.perf_counter() - start_time
+        transcription_file_object = TranscriptionFileObject(
+            text=response_json.get("text", "").strip(),
+            language=response_json.get("language", ""),
+        )
+        try:
+            with transcription_file_path.open("w") as transcription_file:
+                transcription_file.write(transcription_file_object.model_dump_json())
+        except Exception as e:
+            raise IOError(f"There was an error writing the transcription file: {e}")
+        await artifact_cache.aadd(generation_hash, transcription_file_path)
 
-        # Create hash of audio input file content.
-        audio_file_content_hash = md5(audio_file_content).hexdigest()
+    return TranscriptionGeneration(
+        audio_file_path=audio_file_path,
+        cached=use_cached_file,
+        language=transcription_file_object.language,
+        model=model,
+        text_content=transcription_file_object.text,
+        text_file_path=str(Path(transcription_file_path)),
+        timings=timings,
+    )
 
-        generation_hash = md5(
-            f"{model}-{audio_file_content_hash}".encode("utf-8")
-        ).hexdigest()
-        transcription_output_dir = Path(os.getenv("STT_OUTPUT_DIR")).joinpath(
-            "transcription"
-        )
-        transcription_output_dir.mkdir(parents=True, exist_ok=True)
-        transcription_file_path = transcription_output_dir.joinpath(
-            f"{int(time.time())}-{generation_hash}.json"
-        )
 
-        # Create directory or search for already created transcription file.
-        use_cached_file = False
-        if not os.path.exists(transcription_output_dir):
-            os.makedirs(transcription_output_dir)
-        else:
-            for file_name in os.listdir(transcription_output_dir):
-                if fnmatch.fnmatch(file_name, f"*{generation_hash}.json"):
-                    transcription_file_path = transcription_output_dir.joinpath(
-                        file_name
-                    )
-                    print("Using cached file...")
-                    use_cached_file = True
-                    try:
-                        with open(transcription_file_path, "r") as transcription_file:
-                            transcription_file_object = (
-                                TranscriptionFileObject.model_validate_json(
-                                    transcription_file.read()
-                                )
-                            )
-                    except Exception as e:
-                        raise IOError(
-                            f"There was an error reading the transcription file: {e}"
-                        )
-
-        if not use_cached_file:
-            # Transcription request.
-            async with openai_client.audio.transcriptions.with_streaming_response.create(
-                model=model,
-                file=audio_file_content,
-            ) as response:
-                response_json = await response.json()
-                transcription_file_object = TranscriptionFileObject(
-                    text=response_json.get("text", "").strip(),
-                    language=response_json.get("language", ""),
-                )
-                try:
-                    with transcription_file_path.open("w") as transcription_file:
-                        transcription_file.write(
-                            transcription_file_object.model_dump_json()
-                        )
-                except Exception as e:
-                    raise IOError(
-                        f"There was an error writing the transcription file: {e}"
-                    )
-
-        generations.append(
-            TranscriptionGeneration(
-                audio_file_path=audio_file_path,
-                cached=use_cached_file,
-                language=transcription_file_object.language,
-                model=model,
-                text_content=transcription_file_object.text,
-                text_file_path=str(Path(transcription_file_path)),
+async def transcribe_audio(
+    audio_file_paths: list[str],
+) -> list[TranscriptionGeneration | TranscriptionGenerationError]:
+    """Transcribe the files concurrently (up to `STT_CONCURRENCY` at a time).
+
+    Results keep the order of the files; a failed file results in a
+    `TranscriptionGenerationError` instead of failing the others.
+    """
+    model = get_settings().model_stt
+    artifact_cache = get_artifact_cache(ArtifactKind.STT)
+    semaphore = asyncio.Semaphore(get_settings().stt_concurrency)
+
+    async def _transcribe(audio_file_path: str) -> TranscriptionGeneration:
+        async with semaphore:
+            return await _transcribe_file(model, audio_file_path, artifact_cache)
+
+    results = await asyncio.gather(
+        *(_transcribe(audio_file_path) for audio_file_path in audio_file_paths),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, Exception):
+            # E.g. cancelled.
+            raise result
+    return [
+        (
+            TranscriptionGenerationError(
+                audio_file_path=audio_file_path, error=f"{result}"
             )
+            if isinstance(result, Exception)
+            else result
         )
-
-    return generations
+        for audio_file_path, result in zip(audio_file_paths, results)
+    ]
 
 
 @tool(
@@ -157,13 +200,12 @@ async def call_transcribe_audio(
         return Command(update={"messages": [tool_error_message]})
 
     # Resolve reference keys to actual file paths.
-    file_paths: list[str] = []
-    for ref in file_path_refs:
-        file_path = await get_reference_value(
-            runtime.store,
-            runtime.config["configurable"]["context"]["user_id"],
-            ref,
-        )
+    file_paths = await get_reference_values(
+        runtime.store,
+        runtime.config["configurable"]["context"]["user_id"],
+        file_path_refs,
+    )
+    for ref, file_path in zip(file_path_refs, file_paths):
         if file_path is None:
             tool_error_message = ToolMessage(
                 content=f"Reference '{ref}' not found.",
@@ -172,10 +214,9 @@ async def call_transcribe_audio(
             )
             tool_error_message.pretty_print()
             return Command(update={"messages": [tool_error_message]})
-        file_paths.append(file_path)
 
     try:
-        generations = await transcribe_audio(file_paths)
+        results = await transcribe_audio(file_paths)
     except Exception as e:
         tool_error_message = ToolMessage(
             content=f"{e}",
@@ -185,27 +226,50 @@ async def call_transcribe_audio(
         tool_error_message.pretty_print()
         return Command(update={"messages": [tool_error_message]})
 
-    message_lines = ["Successfully created JSON files containing the transcribed text:"]
+    generations = [
+        result for result in results if isinstance(result, TranscriptionGeneration)
+    ]
+
+    # Resolve the references of all output files in one go (the inputs are the given refs).
+    reference_keys = await get_reference_keys(
+        runtime.store,
+        runtime.config["configurable"]["context"]["user_id"],
+        [generation.text_file_path for generation in generations],
+    )
+    reference_keys_by_path = {
+        generation.text_file_path: reference_key
+        for generation, reference_key in zip(generations, reference_keys)
+    }
+
+    if len(generations) == len(results):
+        message_lines = [
+            "Successfully created JSON files containing the transcribed text:"
+        ]
+    else:
+        message_lines = [
+            f"Created {len(generations)} of {len(results)} JSON files containing the transcribed text:"
+        ]
     generation_artifacts: list[TranscriptionGenerationArtifact] = []
-    for generation in generations:
+    for reference_key_audio_file_path, result in zip(file_path_refs, results):
+        if isinstance(result, TranscriptionGenerationError):
+            message_lines.append(
+                f"  - Input audio file: {reference_key_audio_file_path} -> Error: {result.error}"
+            )
+            continue
+
+        generation = result
         text = (
             f"{generation.text_content[:32].strip()}... (truncated)"
             if len(generation.text_content) > 32
             else generation.text_content
         )
 
-        reference_key_audio_file_path = await get_reference_key(
-            runtime.store,
-            runtime.config["configurable"]["context"]["user_id"],
-            generation.audio_file_path,
-        )
-        reference_key_text_file_path = await get_reference_key(
-            runtime.store,
-            runtime.config["configurable"]["context"]["user_id"],
-            generation.text_file_path,
-        )
+        reference_key_text_file_path = reference_keys_by_path[generation.text_file_path]
+        timings = generation.timings
         message_lines.append(
             f"  - Input audio file: {reference_key_audio_file_path} -> Transcribed text saved to: {reference_key_text_file_path}"
+            f" (hash {timings.hash_seconds:.3f}s, cache lookup {timings.cache_lookup_seconds:.3f}s,"
+            f" upload + inference {timings.transcription_seconds:.3f}s)"
         )
 
         # Convert transcription generations to transcription generation artifacts.
@@ -217,11 +281,14 @@ async def call_transcribe_audio(
                 model=generation.model,
                 text_content=text,
                 text_file_path_ref=reference_key_text_file_path,
+                timings=timings,
             )
         )
 
     tool_message = ToolMessage(
         content="\n".join(message_lines),
+        # Only an error if no file could be transcribed.
+        status="error" if not generations else "success",
         tool_call_id=runtime.tool_call_id,
         artifact=generation_artifacts,
     )
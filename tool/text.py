@@ -0,0 +1,21 @@
+from functools import cache
+
+
+@cache
+def get_sentencizer():
+    """Return a language-independent spaCy pipeline splitting sentences by punctuation."""
+    # Imported on first use, `spacy` takes seconds to import.
+    import spacy
+
+    nlp = spacy.blank("xx")
+    nlp.add_pipe("sentencizer")
+    return nlp
+
+
+def split_sentences(text: str) -> list[str]:
+    """Split the text into its sentences, without surrounding whitespace."""
+    return [
+        sentence.text.strip()
+        for sentence in get_sentencizer()(text).sents
+        if sentence.text.strip()
+    ]
@@ -1,12 +1,12 @@
+import asyncio
 import base64
-import fnmatch
 import os
+import tempfile
 import time
+from collections.abc import AsyncIterator, Awaitable, Callable
 from hashlib import md5
-from pathlib import Path
 from typing import Literal
 
-from dotenv import load_dotenv
 from langchain_core.messages import ToolMessage
 from langchain_core.tools import tool
 from langgraph.prebuilt import ToolRuntime
@@ -14,14 +14,20 @@ from langgraph.types import Command
 from openai import AsyncOpenAI
 from pydantic import BaseModel, Field
 
-from store.references import get_reference_key
+from cache.artifacts import ArtifactCache, ArtifactKind, get_artifact_cache
+from client.backends import Backend, backend_slot
+from client.http import get_openai_client
+from config.settings import get_settings
+from store.references import get_reference_keys
+from tool.audio import concatenate_wav, mix_dialogue
+from tool.audio_playback import _play_audio, _stream_audio
+from telemetry.metrics import TTS_TIME_TO_FIRST_AUDIO, record_cache_lookup
+from tool.text import split_sentences
 
-load_dotenv()
 
-openai_client = AsyncOpenAI(
-    api_key="none",
-    base_url=os.getenv("API_BASE_URL_MLX_AUDIO"),
-)
+def get_audio_client() -> AsyncOpenAI:
+    # Shares the keep-alive connections and timeouts of the other mlx-audio calls.
+    return get_openai_client("mlx_audio", get_settings().api_base_url_mlx_audio)
 
 
 class VoiceTextPart(BaseModel):
@@ -35,6 +41,20 @@ class TTSInput(BaseModel):
     voice_text_parts: list[VoiceTextPart] = Field(
         description="List of voice/text parts to convert to speech"
     )
+    playback_queue_name: str | None = Field(
+        default=None,
+        description="Name of an audio queue to play the parts on as soon as they are generated (optional)",
+    )
+    combine_parts: bool = Field(
+        default=False,
+        description="Combine all parts into a single audio file (e.g. for a dialogue between voices), played without gaps between the parts",
+    )
+    pause_seconds: float | None = Field(
+        default=None,
+        ge=0.0,
+        le=5.0,
+        description="Silence in seconds between the combined parts (optional)",
+    )
 
 
 class TTSGeneration(BaseModel):
@@ -46,6 +66,12 @@ class TTSGeneration(BaseModel):
     voice: str
 
 
+class TTSGenerationError(BaseModel):
+    error: str
+    input: str
+    voice: str
+
+
 class TTSGenerationArtifact(BaseModel):
     audio_file_path_ref: str
     base64_data: str
@@ -55,64 +81,371 @@ class TTSGenerationArtifact(BaseModel):
     voice: str
 
 
-async def generate_speech(
-    voice_text_parts: list[VoiceTextPart],
-) -> list[TTSGeneration]:
-    model = os.getenv("MODEL_TTS")
-
-    generations: list[TTSGeneration] = []
-    for voice_text_part in voice_text_parts:
-        # Allow caching of generated audio.
-        generation_hash = md5(
-            f"{model}-{voice_text_part.voice}-{voice_text_part.text}".encode("utf-8")
-        ).hexdigest()
-        generated_audio_dir = Path(os.getenv("TTS_OUTPUT_DIR"))
-        audio_file_path = generated_audio_dir.joinpath(
-            f"{int(time.time())}-{generation_hash}.wav"
+def _get_generation_hash(model: str, voice_text_part: VoiceTextPart) -> str:
+    return md5(
+        f"{model}-{voice_text_part.voice}-{voice_text_part.text}".encode("utf-8")
+    ).hexdigest()
+
+
+async def _generate_part_speech(
+    model: str,
+    voice_text_part: VoiceTextPart,
+    artifact_cache: ArtifactCache,
+    audio_chunks: asyncio.Queue[bytes | None] | None = None,
+) -> TTSGeneration:
+    """Generate the speech of a part (or take it from the cache).
+
+    If `audio_chunks` is given, the audio is also put on it chunk by chunk as
+    it is received, followed by `None` at the end (also if generation fails).
+    """
+    try:
+        return await _generate_part_speech_chunks(
+            model, voice_text_part, artifact_cache, audio_chunks
         )
+    finally:
+        if audio_chunks is not None:
+            audio_chunks.put_nowait(None)
 
-        # Create directory or search for already generated audio.
-        use_cached_file = False
-        if not os.path.exists(generated_audio_dir):
-            os.makedirs(generated_audio_dir)
-        else:
-            for file_name in os.listdir(generated_audio_dir):
-                if fnmatch.fnmatch(file_name, f"*{generation_hash}.wav"):
-                    audio_file_path = generated_audio_dir.joinpath(file_name)
-                    print(
-                        "Using cached file:",
-                        voice_text_part.voice,
-                        f'"{voice_text_part.text}"',
-                    )
-                    use_cached_file = True
 
-        if not use_cached_file:
-            # Effective TTS request.
-            async with openai_client.audio.speech.with_streaming_response.create(
-                model=model,
-                voice=voice_text_part.voice,
-                input=voice_text_part.text,
-            ) as response:
-                await response.stream_to_file(audio_file_path)
+async def _generate_part_speech_chunks(
+    model: str,
+    voice_text_part: VoiceTextPart,
+    artifact_cache: ArtifactCache,
+    audio_chunks: asyncio.Queue[bytes | None] | None,
+) -> TTSGeneration:
+    # Allow caching of generated audio.
+    generation_hash = _get_generation_hash(model, voice_text_part)
+    audio_file_path = await artifact_cache.alookup(generation_hash)
+
+    use_cached_file = False
+    if audio_file_path is not None:
+        print(
+            "Using cached file:",
+            voice_text_part.voice,
+            f'"{voice_text_part.text}"',
+        )
+        use_cached_file = True
+    record_cache_lookup("tts", use_cached_file)
 
+    if not use_cached_file:
+        # Effective TTS request.
+        audio_file_path = artifact_cache.path_for(generation_hash, ".wav")
+        # Write to a temporary file in the same directory and rename it once
+        # complete, so a concurrent generation of the same part or a failed
+        # one never truncates the cached file (which may be playing).
+        file_descriptor, temp_file_path = tempfile.mkstemp(
+            dir=audio_file_path.parent, prefix=".tts-"
+        )
         try:
-            with open(audio_file_path, "rb") as audio_file:
-                base64_data = base64.b64encode(audio_file.read()).decode("utf-8")
-        except Exception as e:
-            raise IOError(f"There was an error reading the generated file: {e}")
-
-        generations.append(
-            TTSGeneration(
-                base64_data=base64_data,
-                cached=use_cached_file,
-                audio_file_path=str(audio_file_path),
-                input=voice_text_part.text,
-                model=model,
-                voice=voice_text_part.voice,
+            with os.fdopen(file_descriptor, "wb") as audio_file:
+                async with (
+                    backend_slot(Backend.MLX_AUDIO),
+                    get_audio_client().audio.speech.with_streaming_response.create(
+                        model=model,
+                        voice=voice_text_part.voice,
+                        input=voice_text_part.text,
+                    ) as response,
+                ):
+                    # Still written to the cache while the chunks are handed on.
+                    async for chunk in response.iter_bytes():
+                        audio_file.write(chunk)
+                        if audio_chunks is not None:
+                            audio_chunks.put_nowait(chunk)
+            os.replace(temp_file_path, audio_file_path)
+        except BaseException:
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+            raise
+        await artifact_cache.aadd(generation_hash, audio_file_path)
+
+    try:
+        with open(audio_file_path, "rb") as audio_file:
+            audio_data = audio_file.read()
+    except Exception as e:
+        raise IOError(f"There was an error reading the generated file: {e}")
+    if use_cached_file and audio_chunks is not None:
+        audio_chunks.put_nowait(audio_data)
+    base64_data = base64.b64encode(audio_data).decode("utf-8")
+
+    return TTSGeneration(
+        base64_data=base64_data,
+        cached=use_cached_file,
+        audio_file_path=str(audio_file_path),
+        input=voice_text_part.text,
+        model=model,
+        voice=voice_text_part.voice,
+    )
+
+
+async def _concatenate_part_speech(
+    model: str,
+    voice_text_part: VoiceTextPart,
+    artifact_cache: ArtifactCache,
+    sentence_generations: list[TTSGeneration],
+) -> TTSGeneration:
+    """Concatenate the speech of the sentences of a part into the (cached) audio of the part."""
+    generation_hash = _get_generation_hash(model, voice_text_part)
+    audio_file_path = artifact_cache.path_for(generation_hash, ".wav")
+    # Concatenated into a temporary file and renamed, like generated speech.
+    file_descriptor, temp_file_path = tempfile.mkstemp(
+        dir=audio_file_path.parent, prefix=".tts-"
+    )
+    os.close(file_descriptor)
+    try:
+        await asyncio.to_thread(
+            concatenate_wav,
+            [generation.audio_file_path for generation in sentence_generations],
+            temp_file_path,
+        )
+        os.replace(temp_file_path, audio_file_path)
+    except BaseException:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+        raise
+    await artifact_cache.aadd(generation_hash, audio_file_path)
+
+    try:
+        with open(audio_file_path, "rb") as audio_file:
+            base64_data = base64.b64encode(audio_file.read()).decode("utf-8")
+    except Exception as e:
+        raise IOError(f"There was an error reading the generated file: {e}")
+
+    return TTSGeneration(
+        base64_data=base64_data,
+        cached=all(generation.cached for generation in sentence_generations),
+        audio_file_path=str(audio_file_path),
+        input=voice_text_part.text,
+        model=model,
+        voice=voice_text_part.voice,
+    )
+
+
+async def _split_part(
+    model: str,
+    voice_text_part: VoiceTextPart,
+    artifact_cache: ArtifactCache,
+) -> list[VoiceTextPart]:
+    """Split a long part into its sentences, unless the speech of the whole part is cached."""
+    if len(voice_text_part.text) <= get_settings().tts_sentence_split_min_chars:
+        return [voice_text_part]
+    if await artifact_cache.alookup(_get_generation_hash(model, voice_text_part)):
+        return [voice_text_part]
+    sentences = await asyncio.to_thread(split_sentences, voice_text_part.text)
+    if len(sentences) <= 1:
+        return [voice_text_part]
+    return [
+        VoiceTextPart(voice=voice_text_part.voice, text=sentence)
+        for sentence in sentences
+    ]
+
+
+async def _reuse_generation(
+    task: asyncio.Task[TTSGeneration],
+    audio_chunks: asyncio.Queue[bytes | None] | None,
+) -> TTSGeneration:
+    """Wait for the generation of an identical part and hand on its audio as a single chunk."""
+    try:
+        generation = await task
+        if audio_chunks is not None:
+            audio_chunks.put_nowait(base64.b64decode(generation.base64_data))
+        return generation
+    finally:
+        if audio_chunks is not None:
+            audio_chunks.put_nowait(None)
+
+
+async def _iterate_audio_chunks(
+    audio_chunks: asyncio.Queue[bytes | None],
+) -> AsyncIterator[bytes]:
+    while (chunk := await audio_chunks.get()) is not None:
+        yield chunk
+
+
+async def generate_speech(
+    voice_text_parts: list[VoiceTextPart],
+    on_generation: Callable[[TTSGeneration], Awaitable[None]] | None = None,
+    on_audio_stream: Callable[[AsyncIterator[bytes]], Awaitable[None]] | None = None,
+    sentence_splitting: bool | None = None,
+) -> list[TTSGeneration | TTSGenerationError]:
+    """Generate the speech of all parts concurrently (up to `TTS_CONCURRENCY` at a time).
+
+    Results keep the order of the parts; a failed part results in a
+    `TTSGenerationError` instead of failing the others. `on_generation` is
+    awaited for each generated part in order, as soon as it and all parts
+    before it are done, e.g. to start playing a dialogue while the rest is
+    still generated. `on_audio_stream` is awaited for each part in order with
+    its audio chunks as they are received, e.g. to play the first part while
+    it is still generated.
+
+    With `sentence_splitting` (default: `TTS_SENTENCE_SPLITTING`), parts
+    longer than `TTS_SENTENCE_SPLIT_MIN_CHARS` are split into sentences,
+    which are generated concurrently and cached on their own (so editing a
+    paragraph only generates the changed sentences again) and concatenated
+    into the audio of the part. `on_audio_stream` is then awaited per sentence.
+    """
+    if sentence_splitting is None:
+        sentence_splitting = get_settings().tts_sentence_splitting
+    model = get_settings().model_tts
+    artifact_cache = get_artifact_cache(ArtifactKind.TTS)
+    semaphore = asyncio.Semaphore(get_settings().tts_concurrency)
+
+    async def _generate(
+        voice_text_part: VoiceTextPart,
+        audio_chunks: asyncio.Queue[bytes | None] | None,
+    ) -> TTSGeneration:
+        async with semaphore:
+            return await _generate_part_speech(
+                model, voice_text_part, artifact_cache, audio_chunks
             )
+
+    # Identical parts and sentences (also within or across parts) are
+    # generated once, as they share their cached file.
+    generation_tasks: dict[str, asyncio.Task[TTSGeneration]] = {}
+
+    def _create_task(
+        voice_text_part: VoiceTextPart,
+        audio_chunks: asyncio.Queue[bytes | None] | None,
+    ) -> asyncio.Task[TTSGeneration]:
+        generation_hash = _get_generation_hash(model, voice_text_part)
+        task = generation_tasks.get(generation_hash)
+        if task is not None:
+            return asyncio.create_task(_reuse_generation(task, audio_chunks))
+        task = asyncio.create_task(_generate(voice_text_part, audio_chunks))
+        generation_tasks[generation_hash] = task
+        return task
+
+    # Segments of a part are its sentences, or the part itself if not split.
+    part_segments = [
+        (
+            await _split_part(model, part, artifact_cache)
+            if sentence_splitting
+            else [part]
         )
+        for part in voice_text_parts
+    ]
+    # Chunks of later segments are buffered until the segments before them are handed on.
+    part_audio_chunk_queues = [
+        [
+            asyncio.Queue() if on_audio_stream is not None else None
+            for _ in segments
+        ]
+        for segments in part_segments
+    ]
+    part_tasks = [
+        [
+            _create_task(segment, audio_chunks)
+            for segment, audio_chunks in zip(segments, audio_chunk_queues)
+        ]
+        for segments, audio_chunk_queues in zip(part_segments, part_audio_chunk_queues)
+    ]
+    # Concatenated parts by generation hash, reused for repeated split parts.
+    concatenated_generations: dict[str, TTSGeneration] = {}
+    results: list[TTSGeneration | TTSGenerationError] = []
+    try:
+        # Await in order, so finished parts are handed on in order while later ones still run.
+        for voice_text_part, tasks, audio_chunk_queues in zip(
+            voice_text_parts, part_tasks, part_audio_chunk_queues
+        ):
+            for audio_chunks in audio_chunk_queues:
+                if audio_chunks is not None:
+                    await on_audio_stream(_iterate_audio_chunks(audio_chunks))
+            try:
+                segment_results = await asyncio.gather(*tasks, return_exceptions=True)
+                for segment_result in segment_results:
+                    if isinstance(segment_result, BaseException):
+                        raise segment_result
+                generation_hash = _get_generation_hash(model, voice_text_part)
+                if len(segment_results) == 1:
+                    generation = segment_results[0]
+                elif generation_hash in concatenated_generations:
+                    generation = concatenated_generations[generation_hash]
+                else:
+                    # Repeated sentences share one result, concatenated as often as they occur.
+                    generation = await _concatenate_part_speech(
+                        model, voice_text_part, artifact_cache, segment_results
+                    )
+                    concatenated_generations[generation_hash] = generation
+            except Exception as e:
+                results.append(
+                    TTSGenerationError(
+                        error=f"{e}",
+                        input=voice_text_part.text,
+                        voice=voice_text_part.voice,
+                    )
+                )
+                continue
+            results.append(generation)
+            if on_generation is not None:
+                await on_generation(generation)
+    except BaseException:
+        for tasks in part_tasks:
+            for task in tasks:
+                task.cancel()
+        raise
+
+    return results
+
+
+async def generate_dialogue(
+    generations: list[TTSGeneration], pause_seconds: float | None = None
+) -> TTSGeneration:
+    """Mix generated parts into a single (cached) audio file of the whole dialogue.
+
+    The parts are separated by `pause_seconds` of silence (default:
+    `TTS_DIALOGUE_PAUSE_SECONDS`).
+    """
+    if pause_seconds is None:
+        pause_seconds = get_settings().tts_dialogue_pause_seconds
+    model = get_settings().model_tts
+    artifact_cache = get_artifact_cache(ArtifactKind.TTS)
 
-    return generations
+    # Allow caching of mixed dialogues.
+    generation_hash = md5(
+        "-".join(
+            [
+                model,
+                "dialogue",
+                f"{pause_seconds}",
+                *(
+                    f"{generation.voice}-{generation.input}"
+                    for generation in generations
+                ),
+            ]
+        ).encode("utf-8")
+    ).hexdigest()
+    audio_file_path = await artifact_cache.alookup(generation_hash)
+
+    use_cached_file = audio_file_path is not None
+    if use_cached_file:
+        print("Using cached dialogue file:", f"{len(generations)} parts")
+    record_cache_lookup("tts", use_cached_file)
+
+    if not use_cached_file:
+        audio_file_path = artifact_cache.path_for(generation_hash, ".wav")
+        await asyncio.to_thread(
+            mix_dialogue,
+            [generation.audio_file_path for generation in generations],
+            audio_file_path,
+            pause_seconds,
+        )
+        await artifact_cache.aadd(generation_hash, audio_file_path)
+
+    try:
+        with open(audio_file_path, "rb") as audio_file:
+            base64_data = base64.b64encode(audio_file.read()).decode("utf-8")
+    except Exception as e:
+        raise IOError(f"There was an error reading the generated file: {e}")
+
+    return TTSGeneration(
+        base64_data=base64_data,
+        cached=use_cached_file,
+        audio_file_path=str(audio_file_path),
+        input="\n".join(
+            f"{generation.voice}: {generation.input}" for generation in generations
+        ),
+        model=model,
+        voice=", ".join(dict.fromkeys(generation.voice for generation in generations)),
+    )
 
 
 @tool(
@@ -122,6 +455,9 @@ async def generate_speech(
 )
 async def convert_text_to_speech(
     voice_text_parts: list[VoiceTextPart],
+    playback_queue_name: str | None,
+    combine_parts: bool,
+    pause_seconds: float | None,
     runtime: ToolRuntime,
 ) -> Command:
     if len(voice_text_parts) == 0:
@@ -133,8 +469,59 @@ async def convert_text_to_speech(
         tool_error_message.pretty_print()
         return Command(update={"messages": [tool_error_message]})
 
+    # Hand generated parts to playback in order, while the later ones are still
+    # generated (combined parts are played as a whole once mixed).
+    stream_playback = (
+        playback_queue_name is not None
+        and not combine_parts
+        and get_settings().tts_stream_playback
+    )
+    playback_errors: list[str] = []
+    dialogue_file_path: str | None = None
+    start_time = time.perf_counter()
+    first_audio_times: list[float] = []
+
+    def _record_first_audio():
+        if not first_audio_times:
+            first_audio_times.append(time.perf_counter() - start_time)
+            TTS_TIME_TO_FIRST_AUDIO.labels(
+                mode="stream" if stream_playback else "file"
+            ).observe(first_audio_times[0])
+
+    async def _play_generation(generation: TTSGeneration):
+        if playback_queue_name is None or stream_playback or playback_errors:
+            return
+        if combine_parts and generation.audio_file_path != dialogue_file_path:
+            return
+        try:
+            await _play_audio(playback_queue_name, [generation.audio_file_path])
+            _record_first_audio()
+        except Exception as e:
+            playback_errors.append(f"{e}")
+
+    async def _stream_generation(audio_chunks: AsyncIterator[bytes]):
+        # Wait for the first chunk, so failed parts don't open an empty stream.
+        first_chunk = await anext(audio_chunks, None)
+        if first_chunk is None or playback_errors:
+            return
+
+        async def _chunks() -> AsyncIterator[bytes]:
+            _record_first_audio()
+            yield first_chunk
+            async for chunk in audio_chunks:
+                yield chunk
+
+        try:
+            await _stream_audio(playback_queue_name, _chunks())
+        except Exception as e:
+            playback_errors.append(f"{e}")
+
     try:
-        generations = await generate_speech(voice_text_parts)
+        results = await generate_speech(
+            voice_text_parts,
+            on_generation=_play_generation,
+            on_audio_stream=_stream_generation if stream_playback else None,
+        )
     except Exception as e:
         tool_error_message = ToolMessage(
             content=f"{e}",
@@ -144,22 +531,69 @@ async def convert_text_to_speech(
         tool_error_message.pretty_print()
         return Command(update={"messages": [tool_error_message]})
 
-    message_lines = ["Successfully generated speech audio files:"]
+    generations = [result for result in results if isinstance(result, TTSGeneration)]
+
+    # Mix the parts into a single file with a single reference.
+    is_combined = False
+    if combine_parts and len(generations) > 1:
+        if len(generations) == len(results):
+            try:
+                dialogue = await generate_dialogue(generations, pause_seconds)
+            except Exception as e:
+                tool_error_message = ToolMessage(
+                    content=f"{e}",
+                    status="error",
+                    tool_call_id=runtime.tool_call_id,
+                )
+                tool_error_message.pretty_print()
+                return Command(update={"messages": [tool_error_message]})
+            results = generations = [dialogue]
+            is_combined = True
+            dialogue_file_path = dialogue.audio_file_path
+            await _play_generation(dialogue)
+        else:
+            playback_errors.append("not every part could be generated to combine them")
+    elif combine_parts and generations:
+        # A single part needs no mixing.
+        dialogue_file_path = generations[0].audio_file_path
+        await _play_generation(generations[0])
+
+    # Resolve the references of all generated files in one go.
+    reference_keys = await get_reference_keys(
+        runtime.store,
+        runtime.config["configurable"]["context"]["user_id"],
+        [generation.audio_file_path for generation in generations],
+    )
+    reference_keys_by_path = {
+        generation.audio_file_path: reference_key
+        for generation, reference_key in zip(generations, reference_keys)
+    }
+
+    if is_combined:
+        message_lines = ["Successfully generated a single speech audio file of all parts:"]
+    elif len(generations) == len(results):
+        message_lines = ["Successfully generated speech audio files:"]
+    else:
+        message_lines = [
+            f"Generated {len(generations)} of {len(results)} speech audio files:"
+        ]
     generation_artifacts: list[TTSGenerationArtifact] = []
-    for generation in generations:
-        text = (
-            f"{generation.input[:32]}..."
-            if len(generation.input) > 32
-            else generation.input
-        )
+    for result in results:
+        text = f"{result.input[:32]}..." if len(result.input) > 32 else result.input
+        text = text.replace("\n", " / ")
 
-        reference_key_audio_file_path = await get_reference_key(
-            runtime.store,
-            runtime.config["configurable"]["context"]["user_id"],
-            generation.audio_file_path,
-        )
+        if isinstance(result, TTSGenerationError):
+            message_lines.append(
+                f"  - Input: {result.voice}: {text} -> Error: {result.error}"
+            )
+            continue
+
+        generation = result
+        reference_key_audio_file_path = reference_keys_by_path[generation.audio_file_path]
+        # The input of combined parts already names the voice of each part.
+        input_line = text if is_combined else f"{generation.voice}: {text}"
         message_lines.append(
-            f"  - Input: {generation.voice}: {text} -> Voice audio saved to: {reference_key_audio_file_path}"
+            f"  - Input: {input_line} -> Voice audio saved to: {reference_key_audio_file_path}"
         )
 
         # Convert TTS generations to TTS generation artifacts.
@@ -174,8 +608,29 @@ async def convert_text_to_speech(
             )
         )
 
+    if playback_queue_name is not None:
+        if playback_errors:
+            message_lines.append(
+                f"Playback on queue '{playback_queue_name}' failed: {playback_errors[0]}"
+            )
+        elif stream_playback:
+            message_lines.append(
+                f"Streamed the generated speech to '{playback_queue_name}' for playback"
+                + (
+                    f" (first audio after {first_audio_times[0]:.2f}s)."
+                    if first_audio_times
+                    else "."
+                )
+            )
+        else:
+            message_lines.append(
+                f"Queued the generated files on '{playback_queue_name}' for playback."
+            )
+
     tool_message = ToolMessage(
         content="\n".join(message_lines),
+        # Only an error if no part could be generated.
+        status="error" if not generations else "success",
         tool_call_id=runtime.tool_call_id,
         artifact=generation_artifacts,
     )